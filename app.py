@@ -1,10 +1,22 @@
+import time
+BOOT_START = time.perf_counter()
+
+import base64
 import json
 import os
 import logging
-from flask import Flask, jsonify, request, Response
+import random
+import types
+from flask import Flask, jsonify, request, Response, g
 from flask_cors import CORS
-from mods.MLBStatPredictor import MLBStatPredictor
 from mods.DB2Connect import DB2Connect
+from mods.ModelRegistry import MODEL_REGISTRY
+from mods.JobQueue import JobQueue
+from mods.ResponseCache import ResponseCache
+from mods.Metrics import METRICS
+from mods.SchemaCatalog import CATALOG
+from mods.SingleFlight import SingleFlight
+from mods.Executor import Executor
 from dotenv import load_dotenv, find_dotenv
 
 load_dotenv(find_dotenv())
@@ -14,64 +26,375 @@ DB2_CREDS = {
     "pw": os.environ.get("DB2_PW"),
     "host": os.environ.get("DB2_HOST"),
     "port": os.environ.get("DB2_PORT"),
-    "db": os.environ.get("DB2_DB")
+    "db": os.environ.get("DB2_DB"),
+    "url": os.environ.get("DB_URL"),
+    "backend": os.environ.get("DB_BACKEND", "db2"),
+    "sqlite_path": os.environ.get("SQLITE_PATH")
+}
+
+DB_POOL_OPTIONS = {
+    "pool_size": int(os.environ.get("DB_POOL_SIZE", "5")),
+    "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", "5")),
+    "pool_timeout": int(os.environ.get("DB_POOL_TIMEOUT", "30")),
+    "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", "1800")),
+    "connect_retries": int(os.environ.get("DB_CONNECT_RETRIES", "3")),
+    "connect_backoff": float(os.environ.get("DB_CONNECT_BACKOFF", "0.5")),
+    "stats_table_check_seconds": int(os.environ.get("STATS_TABLE_CHECK_SECONDS", "60")),
+    "stats_table_ttl": int(os.environ.get("STATS_TABLE_TTL", "3600"))
 }
 
 app = Flask(__name__)
 CORS(app)
-DB2 = DB2Connect(DB2_CREDS)
+DB2 = DB2Connect(DB2_CREDS, os.environ.get("SNAPSHOT_DIR"), os.environ.get("DB2_SCHEMA", "MLN78422"), DB_POOL_OPTIONS)
+
+# Chart and player responses only change when one of the DB2Connect write paths runs
+RESPONSE_CACHE = ResponseCache(
+    int(os.environ.get("RESPONSE_CACHE_SIZE", "256")),
+    int(os.environ.get("RESPONSE_CACHE_TTL", "300")),
+    os.environ.get("RESPONSE_CACHE_GENERATION_FILE", os.path.join(os.path.abspath(os.curdir), ".response_cache_generation"))
+)
+DB2.write_listeners.append(RESPONSE_CACHE.invalidate)
+
+# Identical concurrent requests share one execution, write paths also lock across workers
+SINGLE_FLIGHT = SingleFlight(
+    os.environ.get("SINGLE_FLIGHT_DIR", os.path.join(os.path.abspath(os.curdir), ".singleflight")),
+    result_ttl=int(os.environ.get("SINGLE_FLIGHT_RESULT_TTL", "3600"))
+)
+
+# DB2 calls run on native threads and model work in spawned processes, so neither blocks the gevent hub
+EXECUTOR = Executor(
+    int(os.environ.get("IO_WORKERS", "10")),
+    int(os.environ.get("CPU_WORKERS", "2"))
+)
 
 # Setup Logging
 gu_logger = logging.getLogger('gunicorn.error')
 app.logger.handlers = gu_logger.handlers
 app.logger.setLevel(gu_logger.level)
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+
+@app.after_request
+def record_request_metrics(response):
+    # Streamed responses are timed up to the first byte
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    if hasattr(g, "request_start"):
+        METRICS.observe(
+            "http_request_duration_seconds",
+            time.perf_counter() - g.request_start,
+            route=route,
+            method=request.method,
+            status=response.status_code
+        )
+    return response
+
+
+
+# Cross validation pool used by create_xgboost_model
+CV_OPTIONS = {
+    "max_workers": int(os.environ.get("CV_WORKERS", "0")) or None,
+    "executor": os.environ.get("CV_EXECUTOR", "thread"),
+    "early_stopping_rounds": int(os.environ.get("CV_EARLY_STOPPING_ROUNDS", "0")) or None
+}
+
+# Successive halving search, each rung gets its own thread pool inside a cpu pool process
+SEARCH_OPTIONS = {
+    "max_workers": int(os.environ.get("SEARCH_WORKERS", "0")) or None
+}
+
+# Loaded by /readyz?warm=1 rather than at import, so a worker boots without xgboost
+PRELOAD_MODELS = [m.strip() for m in os.environ.get("PRELOAD_MODELS", "prod_model").split(",") if m.strip()]
+
+# Page size for /api/v2/predicted-stats-all
+PAGE_SIZE_DEFAULT = int(os.environ.get("PAGE_SIZE_DEFAULT", "50"))
+PAGE_SIZE_MAX = int(os.environ.get("PAGE_SIZE_MAX", "500"))
+
+# Import plus module setup, a worker that takes longer than this logs a warning
+BOOT_BUDGET_SECONDS = float(os.environ.get("BOOT_BUDGET_SECONDS", "2"))
+
+
+
+def get_predictor():
+    # Chart and cache routes never import sklearn or xgboost, the first prediction route does
+    from mods.MLBStatPredictor import MLBStatPredictor
+    return MLBStatPredictor('xwoba')
+
+
+
+def run_db(fn, *args):
+    # Streamed results come back as a generator, its chunks are fetched on the io pool as well
+    result = EXECUTOR.run_io(fn, *args)
+    if isinstance(result, types.GeneratorType):
+        return EXECUTOR.iterate_io(result)
+    return result
+
+
+
+def run_predictor(method, *args):
+    # The child process imports sklearn and xgboost, this worker keeps serving requests meanwhile
+    columns = EXECUTOR.run_io(CATALOG.get_columns)
+    return EXECUTOR.run_cpu("mods.MLBStatPredictor:run_method", "xwoba", method, columns, *args)
+
+
+
+def encode_cursor(sort, order, last):
+    # Opaque to clients, ties the (sort value, id) of a page's last row to its sort and order
+    return base64.urlsafe_b64encode(json.dumps([sort, order, last[0], last[1]]).encode()).decode()
+
+
+
+def decode_cursor(cursor, sort, order):
+    try:
+        cursor_sort, cursor_order, value, player_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise Exception("cursor is not valid")
+    if cursor_sort != sort or cursor_order != order:
+        raise Exception("cursor belongs to a different sort or order")
+    return value, int(player_id)
+
+
+
+def get_predicted_count(actual_year, predicted_year, name_prefix, models):
+    # Same for every page of a filter, kept in the response cache so writes drop it with the pages
+    key = ("predicted-count", actual_year, predicted_year, name_prefix, tuple(models or ()))
+    entry = RESPONSE_CACHE.get(key)
+    if entry is not None:
+        return int(entry["body"])
+
+    token = RESPONSE_CACHE.get_token()
+    total = run_db(DB2.count_predicted_data, actual_year, predicted_year, name_prefix, models)
+    RESPONSE_CACHE.set(key, str(total).encode(), "text/plain", token)
+    return total
+
+
+
+def stream_requested():
+    # ?stream=1 sends the records as a chunked response built from a server side cursor
+    return request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+
+def run_create_xgb_model(req, progress=None):
+    model_type = req["model_type"]
+    year = req["year"]
+    hyper_params = {
+        "n_estimators": req["n_estimators"],
+        "subsample": req["subsample"],
+        "max_depth": req["max_depth"],
+        "learning_rate": req["learning_rate"],
+        "gamma": req["gamma"],
+        "reg_alpha": req["reg_alpha"],
+        "reg_lambda": req["reg_lambda"]
+    }
+
+    app.logger.info(f"Getting data from DB2 - 2015 - {year}")
+    df = run_db(DB2.get_all_data, '2015', str(int(year) - 1))
+    if progress is not None:
+        progress(1, 2)
+
+    app.logger.info("Creating and saving " + model_type)
+    scores = run_predictor("create_xgboost_model", df, model_type, hyper_params, req.get("seed"), CV_OPTIONS)
+    app.logger.info("Model Created!")
+    if progress is not None:
+        progress(2, 2)
+
+    #app.logger.info("Saving scores and hyperparameters to DB2")
+    #DB2.save_xgb_scores(scores, model_type)
+    #DB2.save_xgb_hyperparams(hyper_params, model_type)
+
+    return {
+        "n_estimators": hyper_params["n_estimators"],
+        "subsample": hyper_params["subsample"],
+        "max_depth": hyper_params["max_depth"],
+        "learning_rate": hyper_params["learning_rate"],
+        "gamma": hyper_params["gamma"],
+        "reg_alpha": hyper_params["reg_alpha"],
+        "reg_lambda": hyper_params["reg_lambda"],
+        "training": scores["training"],
+        "mean_cv": scores["mean_cv"],
+        "kfold_cv_avg": scores["kf_cv"],
+        "mse": scores["mse"],
+        "rsquared": scores["r2s"],
+        "explained_var": scores["explained_var"],
+        "seed": scores["seed"],
+        "cv_seconds": scores["cv_seconds"],
+        "cv_folds": scores["cv_folds"]
+    }
+
+
+
+def run_predict_stats(req, progress=None):
+    year = req["year"]
+    model_type = req["model_type"]
+    xgb_only = req["xgb_only"]
+    incremental = bool(req.get("incremental", False))
+
+    def load_inputs():
+        # Incremental runs only recompute players whose input rows or model changed since the last run
+        with DB2.scope():
+            df = DB2.get_all_data('2015', str(int(year) - 1))
+            return df, DB2.get_prediction_fingerprints(int(year)) if incremental else None
+
+    app.logger.info("Getting DB2 data")
+    df, previous = run_db(load_inputs)
+    if progress is not None:
+        progress(1, 3)
+
+    # Per-player progress cannot cross the process boundary, jobs report load, predict and save steps
+    app.logger.info("Running prediction method")
+    predictions = run_predictor("generate_predictions", df, int(year), model_type, xgb_only, None, previous)
+    if progress is not None:
+        progress(2, 3)
+
+    app.logger.info("Saving data in DB2")
+    if incremental:
+        write_stats = run_db(DB2.upsert_year_predictions, predictions, int(year), model_type)
+    else:
+        write_stats = run_db(DB2.replace_year_predictions, predictions, int(year), model_type)
+    if progress is not None:
+        progress(3, 3)
+    app.logger.info(f"Wrote {write_stats['rows']} predictions at {write_stats['rows_per_second']} rows/s")
+
+    return {"players": len(predictions.index), "changed": int(predictions['CHANGED'].sum()), "write": write_stats}
+
+
+
+def normalize_request(kind, req):
+    req = dict(req)
+    req["year"] = str(req["year"])
+    req["model_type"] = str(req["model_type"])
+    return [kind, req]
+
+
+
+def run_exclusive(kind, fn, req, progress=None):
+    # One run per year and model_type on this host at a time, identical requests share its result
+    lock_key = [kind, str(req["year"]), str(req["model_type"])]
+    return SINGLE_FLIGHT.exclusive(lock_key, normalize_request(kind, req), lambda report: fn(req, report), kind, progress)
+
+
+
+JOBS = JobQueue(
+    os.environ.get("JOB_DB_PATH", os.path.join(os.path.abspath(os.curdir), "jobs.sqlite")),
+    int(os.environ.get("JOB_WORKERS", "2")),
+    app.logger,
+    int(os.environ.get("JOB_LEASE_SECONDS", "120"))
+)
+JOBS.register("create-xgb-model", lambda req, progress: run_exclusive("create-xgb-model", run_create_xgb_model, req, progress))
+JOBS.register("predict-stats", lambda req, progress: run_exclusive("predict-stats", run_predict_stats, req, progress))
+JOBS.recover()
+
+
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    # Liveness only, never touches the database or the models
+    return Response(json.dumps({"status": "ok", "pid": os.getpid(), "boot_seconds": BOOT_SECONDS}), status=200, mimetype='application/json')
+
+
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    # ?warm=1 also loads PRELOAD_MODELS, the schema catalog and the mlbstats table cache
+    resp = {"status": "ready", "timings": {}}
+    try:
+        def ping():
+            with DB2.connection():
+                pass
+
+        start = time.perf_counter()
+        run_db(ping)
+        resp["timings"]["db"] = time.perf_counter() - start
+
+        if request.args.get('warm', '').lower() in ('1', 'true', 'yes'):
+            start = time.perf_counter()
+            resp["models"] = run_db(MODEL_REGISTRY.preload, PRELOAD_MODELS)
+            resp["timings"]["models"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            run_db(CATALOG.refresh_if_stale)
+            run_db(DB2.get_stats_table)
+            resp["timings"]["caches"] = time.perf_counter() - start
+
+        return Response(json.dumps(resp), status=200, mimetype='application/json')
+
+    except Exception as e:
+        app.logger.error(e)
+        err_resp = {
+            "status": "unavailable",
+            "errorMsg": repr(e)
+        }
+        return Response(json.dumps(err_resp), status=503, mimetype='application/json')
+
+
 
 @app.route('/api/create-xgb-model', methods=['POST'])
 def create_xgb_model():
     try:
         req = json.loads(request.data)
-        model_type = req["model_type"]
-        year = req["year"]
-        hyper_params = {
-            "n_estimators": req["n_estimators"],
-            "subsample": req["subsample"],
-            "max_depth": req["max_depth"],
-            "learning_rate": req["learning_rate"],
-            "gamma": req["gamma"],
-            "reg_alpha": req["reg_alpha"],
-            "reg_lambda": req["reg_lambda"]
-        }
+        response_val = run_exclusive("create-xgb-model", run_create_xgb_model, req)
+        return Response(json.dumps(response_val), status=200, mimetype='application/json')
 
-        app.logger.info(f"Getting data from DB2 - 2015 - {year}")
-        df = DB2.get_all_data('2015', str(int(year) - 1))
-        
-        app.logger.info("Creating and saving " + model_type)
-        mlb_predict = MLBStatPredictor('xwoba')
-        scores = mlb_predict.create_xgboost_model(df, model_type, hyper_params)
-        app.logger.info("Model Created!")
-        
-        #app.logger.info("Saving scores and hyperparameters to DB2")
-        #DB2.save_xgb_scores(scores, model_type)
-        #DB2.save_xgb_hyperparams(hyper_params, model_type)
-        
-        response_val = {
-            "n_estimators": hyper_params["n_estimators"],
-            "subsample": hyper_params["subsample"],
-            "max_depth": hyper_params["max_depth"],
-            "learning_rate": hyper_params["learning_rate"],
-            "gamma": hyper_params["gamma"],
-            "reg_alpha": hyper_params["reg_alpha"],
-            "reg_lambda": hyper_params["reg_lambda"],
-            "training": scores["training"],
-            "mean_cv": scores["mean_cv"],
-            "kfold_cv_avg": scores["kf_cv"],
-            "mse": scores["mse"],
-            "rsquared": scores["r2s"],
-            "explained_var": scores["explained_var"]
+    except Exception as e:
+        app.logger.error(e)
+        err_resp = {
+            "errorMsg": repr(e)
         }
+        return Response(json.dumps(err_resp), status=400, mimetype='application/json')
 
-        return Response(json.dumps(response_val), status=200, mimetype='application/json')
+
+
+@app.route('/api/xgb-hyperparam-search', methods=['POST'])
+def xgb_hyperparam_search():
+    try:
+        # {"model_type", "year", "space": {"max_depth": {"min": 3, "max": 10}, "learning_rate": [0.05, 0.1]},
+        #  "n_candidates": 27, "eta": 3, "n_splits": 3, "seed": 1, "persist": false}
+        req = json.loads(request.data)
+        model_type = req["model_type"]
+        year = req["year"]
+        persist = bool(req.get("persist", False))
+        search_options = dict(SEARCH_OPTIONS)
+        for key in ("n_candidates", "eta", "n_splits", "min_rounds"):
+            if key in req:
+                search_options[key] = int(req[key])
+        if search_options.get("eta", 3) < 2:
+            raise Exception("eta must be at least 2")
+
+        # Fetched once up front, every rung trains off the same frame
+        app.logger.info(f"Getting data from DB2 - 2015 - {year}")
+        df = run_db(DB2.get_all_data, '2015', str(int(year) - 1))
+
+        # Rungs run one at a time in the cpu pool with the seed fixed here, so this worker only waits
+        # on them. The first one runs before the response starts, a bad space still gets a 400
+        seed = req.get("seed")
+        if seed is None:
+            seed = random.randint(0, 2**31 - 2)
+        first = run_predictor("search_xgboost_rung", df, req["space"], seed, search_options, None, 0)
+
+        def generate():
+            try:
+                event, survivors = first
+                yield json.dumps(event) + "\n"
+                while survivors is not None:
+                    event, survivors = run_predictor("search_xgboost_rung", df, req["space"], seed, search_options, survivors, event["rung"] + 1)
+                    yield json.dumps(event) + "\n"
+
+                winner = event["leaderboard"][0]
+                if persist:
+                    app.logger.info("Saving search winner for " + model_type)
+                    run_db(DB2.save_xgb_scores, winner, model_type)
+                    run_db(DB2.save_xgb_hyperparams, winner["hyper_params"], model_type)
+                yield json.dumps({"event": "done", "winner": winner, "persisted": persist}) + "\n"
+
+            except Exception as e:
+                app.logger.error(e)
+                yield json.dumps({"event": "error", "errorMsg": repr(e)}) + "\n"
+
+        return Response(generate(), status=200, mimetype='application/x-ndjson')
 
     except Exception as e:
         app.logger.error(e)
@@ -87,7 +410,7 @@ def xgb_model_predict():
     try:
         req = json.loads(request.data)
         model_type = req["model_type"]
-        mlb_predict = MLBStatPredictor('xwoba')
+        mlb_predict = get_predictor()
         prediction = mlb_predict.xgboost_predict(req, model_type)
         resp = {
             "predicted xwOBA": prediction
@@ -103,26 +426,39 @@ def xgb_model_predict():
 
 
 
-@app.route('/api/predict-stats', methods=['POST'])
-def predict_stats():
+@app.route('/api/xgb-model-predict-batch', methods=['POST'])
+def xgb_model_predict_batch():
     try:
         req = json.loads(request.data)
-        year = req["year"]
         model_type = req["model_type"]
-        xgb_only = req["xgb_only"]
 
-        app.logger.info("Getting DB2 data")
-        df = DB2.get_all_data('2015', str(int(year) - 1))
+        # Either a list of stat objects or a columnar {"field": [values]} payload
+        rows = req["players"] if "players" in req else req["columns"]
+        if not isinstance(rows, (list, dict)):
+            raise Exception("players must be a list or columns must be an object")
 
-        app.logger.info("Running prediction method")
-        mlb_predict = MLBStatPredictor('xwoba')
-        predictions = mlb_predict.generate_predictions(df, int(year), model_type, xgb_only)
-        
-        app.logger.info("Saving data in DB2")
-        DB2.delete_model_predictions_by_year(int(year))
-        DB2.append_to_table(predictions, "player_predictions", "append")
-        DB2.update_xgb_rsquared(model_type, int(year))
+        mlb_predict = get_predictor()
+        predictions = mlb_predict.xgboost_predict_batch(rows, model_type, req.get("ages"))
+        resp = {
+            "predictions": predictions,
+            "errors": sum(1 for p in predictions if "errorMsg" in p)
+        }
+        return Response(json.dumps(resp), status=200, mimetype='application/json')
 
+    except Exception as e:
+        app.logger.error(e)
+        err_resp = {
+            "errorMsg": repr(e)
+        }
+        return Response(json.dumps(err_resp), status=400, mimetype='application/json')
+
+
+
+@app.route('/api/predict-stats', methods=['POST'])
+def predict_stats():
+    try:
+        req = json.loads(request.data)
+        run_exclusive("predict-stats", run_predict_stats, req)
         return Response(status=201, mimetype='application/json')
 
     except Exception as e:
@@ -134,10 +470,152 @@ def predict_stats():
 
 
 
+@app.route('/api/jobs/<kind>', methods=['POST'])
+def submit_job(kind):
+    try:
+        if kind not in JOBS.handlers:
+            raise Exception("Unknown job type " + kind)
+
+        # Same kind, year, model_type and options share one running job
+        req = json.loads(request.data)
+        kind, req = normalize_request(kind, req)
+        dedupe_key = json.dumps([kind, req], sort_keys=True)
+        job = JOBS.submit(kind, req, dedupe_key)
+        return Response(json.dumps(job), status=202, mimetype='application/json')
+
+    except Exception as e:
+        app.logger.error(e)
+        err_resp = {
+            "errorMsg": repr(e)
+        }
+        return Response(json.dumps(err_resp), status=400, mimetype='application/json')
+
+
+
+@app.route('/api/jobs/<job_id>/status', methods=['GET'])
+def get_job_status(job_id):
+    try:
+        job = JOBS.get_job(job_id)
+        if job is None:
+            raise Exception("Job does not exist")
+
+        resp = {
+            "job_id": job["job_id"],
+            "kind": job["kind"],
+            "status": job["status"],
+            "progress_done": job["progress_done"],
+            "progress_total": job["progress_total"],
+            "error": job["error"],
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"]
+        }
+        return Response(json.dumps(resp), status=200, mimetype='application/json')
+
+    except Exception as e:
+        app.logger.error(e)
+        err_resp = {
+            "errorMsg": repr(e)
+        }
+        return Response(json.dumps(err_resp), status=404, mimetype='application/json')
+
+
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    try:
+        job = JOBS.get_job(job_id)
+        if job is None:
+            raise Exception("Job does not exist")
+        if job["status"] == "failed":
+            return Response(json.dumps({"errorMsg": job["error"]}), status=500, mimetype='application/json')
+        if job["status"] != "done":
+            return Response(json.dumps({"status": job["status"]}), status=202, mimetype='application/json')
+
+        return Response(json.dumps(job["result"]), status=200, mimetype='application/json')
+
+    except Exception as e:
+        app.logger.error(e)
+        err_resp = {
+            "errorMsg": repr(e)
+        }
+        return Response(json.dumps(err_resp), status=404, mimetype='application/json')
+
+
+
+@app.route('/api/cache/snapshots', methods=['GET'])
+def get_snapshot_stats():
+    try:
+        if DB2.snapshots is None:
+            raise Exception("Snapshot cache is not enabled")
+        return Response(json.dumps(DB2.snapshots.get_stats()), status=200, mimetype='application/json')
+
+    except Exception as e:
+        app.logger.error(e)
+        err_resp = {
+            "errorMsg": repr(e)
+        }
+        return Response(json.dumps(err_resp), status=400, mimetype='application/json')
+
+
+
+@app.route('/api/cache/snapshots', methods=['DELETE'])
+def invalidate_snapshots():
+    try:
+        if DB2.snapshots is None:
+            raise Exception("Snapshot cache is not enabled")
+        year = request.args.get('year')
+        removed = DB2.snapshots.invalidate(int(year) if year else None)
+        return Response(json.dumps({"removed": removed}), status=200, mimetype='application/json')
+
+    except Exception as e:
+        app.logger.error(e)
+        err_resp = {
+            "errorMsg": repr(e)
+        }
+        return Response(json.dumps(err_resp), status=400, mimetype='application/json')
+
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    for key, value in DB2.get_pool_stats().items():
+        METRICS.set_gauge("db_pool_" + key, value)
+    for key, value in RESPONSE_CACHE.get_stats().items():
+        METRICS.set_gauge("response_cache_" + key, value)
+    for key, value in SINGLE_FLIGHT.get_stats().items():
+        METRICS.set_gauge("singleflight_" + key, value)
+    for pool, stats in EXECUTOR.get_stats().items():
+        for key, value in stats.items():
+            METRICS.set_gauge("executor_" + key, value, pool=pool)
+    return Response(METRICS.render(), status=200, mimetype='text/plain; version=0.0.4')
+
+
+
+@app.route('/api/db-pool-stats', methods=['GET'])
+def get_db_pool_stats():
+    return Response(json.dumps(DB2.get_pool_stats()), status=200, mimetype='application/json')
+
+
+
+@app.route('/api/cache/responses', methods=['GET'])
+def get_response_cache_stats():
+    return Response(json.dumps(RESPONSE_CACHE.get_stats()), status=200, mimetype='application/json')
+
+
+
+@app.route('/api/cache/responses', methods=['DELETE'])
+def invalidate_response_cache():
+    RESPONSE_CACHE.invalidate()
+    return Response(json.dumps(RESPONSE_CACHE.get_stats()), status=200, mimetype='application/json')
+
+
+
 @app.route('/api/predicted-stats-all', methods=['GET'])
+@RESPONSE_CACHE.cached
+@SINGLE_FLIGHT.coalesced
 def get_predicted_stats_all():
     try:
-        stats = DB2.get_all_predicted_data()
+        stats = run_db(DB2.get_all_predicted_data, stream_requested())
         return Response(stats, status=200, mimetype='application/json')
 
     except Exception as e:
@@ -149,10 +627,69 @@ def get_predicted_stats_all():
 
 
 
+@app.route('/api/v2/predicted-stats-all', methods=['GET'])
+@RESPONSE_CACHE.cached
+@SINGLE_FLIGHT.coalesced
+def get_predicted_stats_page():
+    try:
+        # ?actual_year=2021&predicted_year=2022&sort=predicted_xwoba&order=desc&limit=50&q=jud&model=prod_model,sklearn&cursor=...
+        actual_year = int(request.args.get('actual_year', 2021))
+        predicted_year = int(request.args.get('predicted_year', actual_year + 1))
+        sort = request.args.get('sort', 'actual_xwoba')
+        order = request.args.get('order', 'desc').lower()
+        if order not in ('asc', 'desc'):
+            raise Exception("order must be asc or desc")
+
+        limit = int(request.args.get('limit', PAGE_SIZE_DEFAULT))
+        if limit < 1 or limit > PAGE_SIZE_MAX:
+            raise Exception(f"limit must be between 1 and {PAGE_SIZE_MAX}")
+
+        name_prefix = request.args.get('q', '').strip() or None
+        models = [m.strip() for m in request.args.get('model', '').split(',') if m.strip()] or None
+        after = decode_cursor(request.args['cursor'], sort, order) if request.args.get('cursor') else None
+
+        rows, last = run_db(
+            DB2.get_predicted_page,
+            actual_year,
+            predicted_year,
+            sort,
+            order == 'desc',
+            limit,
+            after,
+            name_prefix,
+            models
+        )
+        meta = {
+            "actual_year": actual_year,
+            "predicted_year": predicted_year,
+            "sort": sort,
+            "order": order,
+            "limit": limit,
+            "total": get_predicted_count(actual_year, predicted_year, name_prefix, models),
+            "next_cursor": encode_cursor(sort, order, last) if last is not None else None
+        }
+
+        # rows is already serialized, splice it in rather than parsing it back
+        return Response(json.dumps(meta)[:-1] + ', "rows": ' + rows + '}', status=200, mimetype='application/json')
+
+    except Exception as e:
+        app.logger.error(e)
+        err_resp = {
+            "errorMsg": repr(e)
+        }
+        return Response(json.dumps(err_resp), status=400, mimetype='application/json')
+
+
+
 @app.route('/api/charts/histogram', methods=['GET'])
+@RESPONSE_CACHE.cached
+@SINGLE_FLIGHT.coalesced
 def get_histogram_data():
     try:
-        hist_data = DB2.get_histogram_data(request.args['field'])
+        if request.args.get('mode') == 'bins':
+            return get_histogram_bins()
+
+        hist_data = run_db(DB2.get_histogram_data, request.args['field'], stream_requested())
         if not hist_data:
             raise Exception("Requested field does not exist")
 
@@ -167,10 +704,39 @@ def get_histogram_data():
 
 
 
+def get_histogram_bins():
+    # ?mode=bins&field=XWOBA,B_HOME_RUN&bins=20&range=0,0.6&year=2021&min_pa=100
+    value_range = None
+    if request.args.get('range'):
+        value_range = tuple(float(v) for v in request.args['range'].split(','))
+        if len(value_range) != 2:
+            raise Exception("range must be min,max")
+
+    bins = int(request.args.get('bins', 20))
+    if bins < 1 or bins > 1000:
+        raise Exception("bins must be between 1 and 1000")
+
+    hist_summary = run_db(
+        DB2.get_histogram_summary,
+        request.args['field'].split(','),
+        bins,
+        value_range,
+        request.args.get('year'),
+        request.args.get('min_pa')
+    )
+    if not hist_summary:
+        raise Exception("Requested field does not exist")
+
+    return Response(json.dumps(hist_summary), status=200, mimetype='application/json')
+
+
+
 @app.route('/api/charts/histogram-stats', methods=['GET'])
+@RESPONSE_CACHE.cached
+@SINGLE_FLIGHT.coalesced
 def get_histogram_stats():
     try:
-        hist_stats = DB2.get_histogram_stats(request.args['field'])
+        hist_stats = run_db(DB2.get_histogram_stats, request.args['field'])
         if not hist_stats:
             raise Exception("Requested field does not exist")
 
@@ -186,9 +752,11 @@ def get_histogram_stats():
 
 
 @app.route('/api/charts/scatter', methods=['GET'])
+@RESPONSE_CACHE.cached
+@SINGLE_FLIGHT.coalesced
 def get_scatter_data():
     try:
-        scatter_data = DB2.get_scatter_data(request.args['field'])
+        scatter_data = run_db(DB2.get_scatter_data, request.args['field'], stream_requested())
         if not scatter_data:
             raise Exception("Requested field does not exist")
 
@@ -204,10 +772,12 @@ def get_scatter_data():
 
 
 @app.route('/api/charts/radar', methods=['GET'])
+@RESPONSE_CACHE.cached
+@SINGLE_FLIGHT.coalesced
 def get_radar_player_data():
     try:
         player_id = request.args['playerid']
-        radar_data = DB2.get_radar_player_data(player_id)
+        radar_data = run_db(DB2.get_radar_player_data, player_id)
         return Response(radar_data, status=200, mimetype='application/json')
 
     except Exception as e:
@@ -220,10 +790,12 @@ def get_radar_player_data():
 
 
 @app.route('/api/charts/line', methods=['GET'])
+@RESPONSE_CACHE.cached
+@SINGLE_FLIGHT.coalesced
 def get_line_player_data():
     try:
         player_id = request.args['playerid']
-        line_data = DB2.get_line_player_data(player_id)
+        line_data = run_db(DB2.get_line_player_data, player_id)
         return Response(line_data, status=200, mimetype='application/json')
 
     except Exception as e:
@@ -236,10 +808,12 @@ def get_line_player_data():
 
 
 @app.route('/api/player-stats', methods=['GET'])
+@RESPONSE_CACHE.cached
+@SINGLE_FLIGHT.coalesced
 def get_player_stats_all():
     try:
         player_id = request.args['playerid']
-        line_data = DB2.get_player_data_all(player_id)
+        line_data = run_db(DB2.get_player_data_all, player_id)
         return Response(line_data, status=200, mimetype='application/json')
 
     except Exception as e:
@@ -252,9 +826,10 @@ def get_player_stats_all():
 
 
 @app.route('/api/prod-model-info', methods=['GET'])
+@RESPONSE_CACHE.cached
 def get_prod_model_info():
     try:
-        prod_info = DB2.get_prod_model_info()
+        prod_info = run_db(DB2.get_prod_model_info)
         return Response(prod_info, status=200, mimetype='application/json')
 
     except Exception as e:
@@ -262,4 +837,13 @@ def get_prod_model_info():
         err_resp = {
             "errorMsg": repr(e)
         }
-        return Response(json.dumps(err_resp), status=400, mimetype='application/json')
\ No newline at end of file
+        return Response(json.dumps(err_resp), status=400, mimetype='application/json')
+
+
+
+BOOT_SECONDS = time.perf_counter() - BOOT_START
+METRICS.set_gauge("app_boot_seconds", BOOT_SECONDS)
+if BOOT_SECONDS > BOOT_BUDGET_SECONDS:
+    app.logger.warning(f"App boot took {BOOT_SECONDS:.2f}s, over the {BOOT_BUDGET_SECONDS}s budget")
+else:
+    app.logger.info(f"App boot took {BOOT_SECONDS:.2f}s")
@@ -0,0 +1,285 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import numpy as np
+import xgboost
+from mods.ModelRegistry import MODEL_REGISTRY
+from mods.MLBStatPredictor import MLBStatPredictor, run_method
+from mods.SchemaCatalog import CATALOG
+from mods.PlayerFeatureStore import PlayerFeatureStore
+from mods.TreeEvaluator import TreeEvaluator
+from benchmarks.synthetic import generate_mlbstats
+
+
+HYPER_PARAMS = {
+    "n_estimators": 100,
+    "subsample": 0.8,
+    "max_depth": 4,
+    "learning_rate": 0.1,
+    "gamma": 0,
+    "reg_alpha": 0,
+    "reg_lambda": 1
+}
+
+SEARCH_SPACE = {"max_depth": {"min": 3, "max": 8}, "learning_rate": [0.05, 0.1, 0.3], "n_estimators": [100, 200]}
+SEARCH_OPTIONS = {"n_candidates": 9, "eta": 3, "n_splits": 3}
+
+
+def measure(fn, repeat):
+    # Best wall time over the repeats, peak python-tracked memory of the first run
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), peak
+
+
+
+def build_stages(df, model_nm, sample_players):
+    # The xgboost stages time xgboost itself whatever USE_TREE_EVALUATOR says, the evaluator has its own stages
+    MODEL_REGISTRY.use_tree_evaluator = False
+    MODEL_REGISTRY.evict()
+
+    mlb_predict = MLBStatPredictor('xwoba')
+    year = int(df['mlb_year'].max()) + 1
+    features = CATALOG.feature_names()
+    player_ids = df['player_id'].drop_duplicates().to_numpy()[:sample_players]
+    df_sample = df[df['player_id'].isin(player_ids)]
+    single_row = df.iloc[0][features].to_dict()
+    batch_rows = df[features].to_dict('records')
+    evaluator = TreeEvaluator.from_model(MODEL_REGISTRY.get_model(model_nm))
+    matrix = df[features].to_numpy(dtype='float32')
+
+    return [
+        ("generate_predictions", len(df.index), lambda: mlb_predict.generate_predictions(df, year, model_nm, False)),
+        ("generate_predictions_xgb_only", len(df.index), lambda: mlb_predict.generate_predictions(df, year, model_nm, True)),
+        ("predict_player_sklearn", len(player_ids), lambda: [
+            mlb_predict.predict_player_sklearn(df_player, year) for _, df_player in df_sample.groupby('player_id') if len(df_player.index) >= 3
+        ]),
+        ("create_xgboost_model", len(df.index), lambda: mlb_predict.create_xgboost_model(df, model_nm, HYPER_PARAMS, seed=0)),
+        ("xgboost_predict_single", 1, lambda: mlb_predict.xgboost_predict(single_row, model_nm)),
+        ("xgboost_predict_batch", len(batch_rows), lambda: mlb_predict.xgboost_predict_batch(batch_rows, model_nm)),
+        ("tree_evaluator_single", 1, lambda: evaluator.predict(matrix[:1])),
+        ("tree_evaluator_batch", len(matrix), lambda: evaluator.predict(matrix)),
+        ("player_feature_store", len(df.index), lambda: PlayerFeatureStore(df, ['mlb_year', 'xwoba'] + features)),
+        ("to_json_records", len(df.index), lambda: df.to_json(orient='records'))
+    ]
+
+
+
+def run(args):
+    results = []
+    for n_players in [int(n) for n in args.players.split(',')]:
+        df = generate_mlbstats(n_players, seed=args.seed)
+
+        # Model for the predict stages, trained once per size into a scratch directory
+        model_dir = tempfile.mkdtemp(prefix="mlb-bench-")
+        MODEL_REGISTRY.model_dir = model_dir
+        MODEL_REGISTRY.evict()
+        xgb = xgboost.XGBRegressor(**HYPER_PARAMS, random_state=args.seed)
+        xgb.fit(df[CATALOG.feature_names()], df['xwoba'])
+        mlb_predict = MLBStatPredictor('xwoba')
+        mlb_predict.dir_path = model_dir
+        mlb_predict.xgboost_save_model(xgb, "bench_model")
+
+        stages = [s for s in build_stages(df, "bench_model", args.sample_players) if not args.stages or s[0] in args.stages.split(',')]
+        for stage_nm, n_items, fn in stages:
+            if stage_nm == "create_xgboost_model" and n_players > args.max_training_players:
+                continue
+            seconds, peak = measure(fn, args.repeat)
+            result = {
+                "stage": stage_nm,
+                "players": n_players,
+                "rows": len(df.index),
+                "items": n_items,
+                "seconds": seconds,
+                "peak_mb": peak / 2**20,
+                "items_per_second": n_items / seconds if seconds > 0 else None
+            }
+            results.append(result)
+            print(f"{stage_nm:32} players={n_players:<7} {seconds * 1000:10.2f} ms  {result['peak_mb']:8.1f} MB")
+
+    output = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "xgboost": xgboost.__version__,
+            "machine": platform.machine(),
+            "seed": args.seed,
+            "repeat": args.repeat
+        },
+        "results": results
+    }
+    with open(args.out, "w") as f:
+        json.dump(output, f, indent=2)
+    print("Results written to " + args.out)
+
+
+
+def compare(args):
+    with open(args.current) as f:
+        current = json.load(f)["results"]
+    with open(args.baseline) as f:
+        baseline = {(r["stage"], r["players"]): r for r in json.load(f)["results"]}
+
+    regressions = 0
+    for result in current:
+        base = baseline.get((result["stage"], result["players"]))
+        if base is None:
+            print(f"{result['stage']:32} players={result['players']:<7} no baseline")
+            continue
+
+        ratio = result["seconds"] / base["seconds"] if base["seconds"] > 0 else float("inf")
+        flag = "REGRESSION" if ratio > 1 + args.threshold else "ok"
+        regressions += flag == "REGRESSION"
+        print(f"{result['stage']:32} players={result['players']:<7} {base['seconds'] * 1000:10.2f} -> {result['seconds'] * 1000:10.2f} ms  x{ratio:5.2f}  {flag}")
+
+    return 1 if regressions else 0
+
+
+
+BOOT_SCRIPT = (
+    "import sys, time; start = time.perf_counter(); import app; "
+    "print(time.perf_counter() - start); "
+    "print(','.join(m for m in ('sklearn', 'xgboost', 'ibm_db', 'pyarrow') if m in sys.modules))"
+)
+
+
+
+HUB_SCRIPT = (
+    "try:\n    from gevent import monkey; monkey.patch_all()\nexcept ImportError:\n    pass\n"
+    "import sys; from benchmarks.run import hub_probe; hub_probe(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]))"
+)
+
+
+
+def hub_probe(mode, n_players, seed, interval=0.005):
+    # Lateness of a 5ms ticker while a hyperparameter search runs on the calling greenlet (inline) or
+    # through Executor.run_cpu (cpu). The ticker is a greenlet when gevent is patched in, a thread otherwise
+    from mods.Executor import Executor, gevent_active
+    df = generate_mlbstats(n_players, seed=seed)
+    columns = CATALOG.get_columns()
+    executor = Executor(2, 2)
+
+    def run_rung(survivors, rung):
+        rung_args = ("xwoba", "search_xgboost_rung", columns, df, SEARCH_SPACE, seed, SEARCH_OPTIONS, survivors, rung)
+        if mode == "inline":
+            return run_method(*rung_args)
+        return executor.run_cpu("mods.MLBStatPredictor:run_method", *rung_args)
+
+    lags = []
+    done = threading.Event()
+
+    def tick():
+        while not done.is_set():
+            start = time.perf_counter()
+            time.sleep(interval)
+            lags.append(time.perf_counter() - start - interval)
+
+    ticker = threading.Thread(target=tick, daemon=True)
+    ticker.start()
+    start = time.perf_counter()
+    event, survivors = run_rung(None, 0)
+    while survivors is not None:
+        event, survivors = run_rung(survivors, event["rung"] + 1)
+    seconds = time.perf_counter() - start
+    done.set()
+    ticker.join()
+
+    print(json.dumps({
+        "mode": mode,
+        "gevent": gevent_active(),
+        "seconds": seconds,
+        "ticks": len(lags),
+        "p50_ms": float(np.percentile(lags, 50) * 1000),
+        "p99_ms": float(np.percentile(lags, 99) * 1000),
+        "max_ms": float(np.max(lags) * 1000)
+    }))
+
+
+
+def hub(args):
+    # Fresh interpreter per mode so gevent patches before anything is imported
+    results = []
+    for mode in ("inline", "cpu"):
+        out = subprocess.run([sys.executable, "-c", HUB_SCRIPT, mode, str(args.players), str(args.seed)], capture_output=True, text=True, check=True)
+        result = json.loads(out.stdout.splitlines()[-1])
+        results.append(result)
+        print(f"{'search ' + mode:32} gevent={str(result['gevent']):5} {result['seconds'] * 1000:10.2f} ms  "
+              f"ticker lag p50 {result['p50_ms']:8.2f} ms  p99 {result['p99_ms']:8.2f} ms  max {result['max_ms']:8.2f} ms")
+    return results
+
+
+
+def boot(args):
+    # Fresh interpreter per run against a scratch SQLite database, nothing is cached between runs
+    scratch = tempfile.mkdtemp(prefix="mlb-boot-")
+    env = dict(
+        os.environ,
+        DB_BACKEND="sqlite",
+        SQLITE_PATH=os.path.join(scratch, "boot.sqlite"),
+        JOB_DB_PATH=os.path.join(scratch, "jobs.sqlite"),
+        RESPONSE_CACHE_GENERATION_FILE=os.path.join(scratch, "generation")
+    )
+
+    timings = []
+    for _ in range(args.repeat):
+        out = subprocess.run([sys.executable, "-c", BOOT_SCRIPT], env=env, capture_output=True, text=True, check=True)
+        seconds, heavy = out.stdout.splitlines()[-2:]
+        timings.append(float(seconds))
+
+    best = min(timings)
+    print(f"{'import app':32} {best * 1000:10.2f} ms  budget {args.budget * 1000:.0f} ms  heavy modules: {heavy or 'none'}")
+    return 1 if best > args.budget or heavy else 0
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the prediction, training and serialization hot paths")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run")
+    run_parser.add_argument("--players", default="100,1000,10000", help="comma separated player counts, up to 100000")
+    run_parser.add_argument("--stages", default="", help="comma separated stage names, all when empty")
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--sample-players", type=int, default=200, help="players used by the per-player sklearn stage")
+    run_parser.add_argument("--max-training-players", type=int, default=10000)
+    run_parser.add_argument("--out", default="bench_results.json")
+
+    compare_parser = sub.add_parser("compare")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+
+    boot_parser = sub.add_parser("boot")
+    boot_parser.add_argument("--repeat", type=int, default=5)
+    boot_parser.add_argument("--budget", type=float, default=2.0, help="seconds allowed for import app")
+
+    hub_parser = sub.add_parser("hub")
+    hub_parser.add_argument("--players", type=int, default=1000)
+    hub_parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    elif args.command == "hub":
+        hub(args)
+    elif args.command == "boot":
+        sys.exit(boot(args))
+    else:
+        sys.exit(compare(args))
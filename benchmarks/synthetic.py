@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+from mods.StorageBackend import MLBSTATS_COLUMNS
+
+
+def generate_mlbstats(n_players, first_year=2015, last_year=2022, seed=0):
+    # Deterministic mlbstats-shaped frame, same columns and order as the real table
+    rng = np.random.default_rng(seed)
+    n_years = last_year - first_year + 1
+
+    # Every player has a contiguous run of seasons ending somewhere in the range
+    seasons = rng.integers(1, n_years + 1, n_players)
+    end_year = rng.integers(first_year, last_year + 1, n_players)
+    end_year = np.maximum(end_year, first_year + seasons - 1)
+    player_idx = np.repeat(np.arange(n_players), seasons)
+    season_no = np.arange(len(player_idx)) - np.repeat(np.cumsum(seasons) - seasons, seasons)
+    mlb_year = np.repeat(end_year - seasons + 1, seasons) + season_no
+    n_rows = len(player_idx)
+
+    # Player talent drives the rate stats, seasons add noise around it
+    talent = rng.normal(0.0, 1.0, n_players)[player_idx]
+    noise = rng.normal(0.0, 0.5, n_rows)
+    skill = talent + noise
+
+    age = np.repeat(rng.integers(21, 33, n_players), seasons) + season_no
+    pa = np.clip(rng.normal(420, 170, n_rows), 50, 720).astype(int)
+    walk = (pa * np.clip(0.085 + 0.015 * skill, 0.02, 0.2)).astype(int)
+    strikeout = (pa * np.clip(0.22 - 0.02 * skill + rng.normal(0, 0.03, n_rows), 0.08, 0.4)).astype(int)
+    ab = pa - walk - rng.integers(0, 8, n_rows)
+    avg = np.clip(0.250 + 0.02 * skill, 0.15, 0.36)
+    hits = (ab * avg).astype(int)
+    home_run = (hits * np.clip(0.12 + 0.04 * skill, 0.0, 0.35)).astype(int)
+    triple = (hits * 0.01).astype(int)
+    double = (hits * 0.2).astype(int)
+    single = hits - home_run - triple - double
+    total_bases = single + 2 * double + 3 * triple + 4 * home_run
+    games = np.clip(pa // 4 + rng.integers(-5, 6, n_rows), 10, 162)
+
+    batting_avg = np.round(hits / ab, 3)
+    slg = np.round(total_bases / ab, 3)
+    obp = np.round((hits + walk) / pa, 3)
+
+    columns = {
+        "last_name": np.char.add("Last", (player_idx % 997).astype(str)),
+        "first_name": np.char.add("First", (player_idx % 89).astype(str)),
+        "player_id": 400000 + player_idx,
+        "mlb_year": mlb_year,
+        "player_age": age,
+        "b_ab": ab,
+        "b_total_pa": pa,
+        "b_total_hits": hits,
+        "b_single": single,
+        "b_double": double,
+        "b_triple": triple,
+        "b_home_run": home_run,
+        "b_strikeout": strikeout,
+        "b_walk": walk,
+        "b_k_percent": np.round(100 * strikeout / pa, 1),
+        "b_bb_percent": np.round(100 * walk / pa, 1),
+        "batting_avg": batting_avg,
+        "slg_percent": slg,
+        "on_base_percent": obp,
+        "on_base_plus_slg": np.round(obp + slg, 3),
+        "isolated_power": np.round(slg - batting_avg, 3),
+        "b_rbi": (home_run * 1.6 + hits * 0.25).astype(int),
+        "b_total_bases": total_bases,
+        "b_ab_scoring": (ab * 0.25).astype(int),
+        "b_game": games,
+        "b_hit_line_drive": (hits * 0.35).astype(int),
+        "b_hit_popup": (ab * 0.07).astype(int),
+        "b_played_dh": rng.integers(0, 30, n_rows),
+        "xwoba": np.round(np.clip(0.315 + 0.03 * skill + rng.normal(0, 0.01, n_rows), 0.2, 0.45), 3)
+    }
+
+    return pd.DataFrame({col: columns[col] for col, _ in MLBSTATS_COLUMNS})
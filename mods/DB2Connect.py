@@ -1,52 +1,333 @@
-import ibm_db
-import ibm_db_dbi
-import ibm_db_sa
+import json
 import sqlalchemy as sa
 import pandas as pd
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from mods.HistogramSummary import summarize_column
+from mods.SchemaCatalog import CATALOG
+from mods.PlayerProfileStore import PlayerProfileStore
+from mods.StorageBackend import create_backend
+from mods.Metrics import METRICS
+
+
+# Paged predicted stats: response key -> (SQL expression, fill used when sorting on a missing value)
+PREDICTED_STATS_COLUMNS = {
+    "id": ("p.PLAYER_ID", None),
+    "first_name": ("p.FIRST_NAME", "''"),
+    "last_name": ("p.LAST_NAME", "''"),
+    "actual_xwoba": ("m.XWOBA", "-1"),
+    "actual_year_predicted_xwoba": ("CAST(ROUND(pp.XWOBA_PREDICTED, 3) AS DECIMAL(6,3))", "-1"),
+    "predicted_xwoba": ("CAST(ROUND(nx.XWOBA_PREDICTED, 3) AS DECIMAL(6,3))", "-1"),
+    "model": ("nx.MODEL", "''")
+}
 
 
 class DB2Connect:
 
 
-    def __init__(self, db2_creds):
-        db2_conn_str = f"db2+ibm_db://{db2_creds['user']}:{db2_creds['pw']}@{db2_creds['host']}:{db2_creds['port']}/{db2_creds['db']}"
+    def __init__(self, db2_creds, snapshot_dir=None, schema_nm='MLN78422', pool_options=None):
+        # "backend": "sqlite" with a "sqlite_path" runs everything against an embedded database
+        self.backend = create_backend(dict(db2_creds, schema=schema_nm))
+        self.pool_options = pool_options or {}
+
+        # Each request or job pins its own pooled connection for the duration of a scope()
+        self.scoped = threading.local()
+        self.pool_lock = threading.Lock()
+        self.pool_stats = {"checkouts": 0, "waiters": 0, "max_waiters": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+
+        # The engine is built by the first checkout, a database that is down at boot only fails requests
+        self.engine = None
+        self.engine_lock = threading.Lock()
+        self.connect_retries = self.pool_options.get("connect_retries", 3)
+        self.connect_backoff = self.pool_options.get("connect_backoff", 0.5)
+
+        # Completed seasons are served from local Arrow files when a snapshot dir is configured
+        self.snapshots = None
+        if snapshot_dir:
+            from mods.SnapshotCache import SnapshotCache
+            self.snapshots = SnapshotCache(snapshot_dir, self.query_all_data)
+
+        # Table metadata is read once per refresh interval instead of on every chart request
+        self.schema_nm = schema_nm
+        CATALOG.bind(self.query_stats_schema)
+
+        self.prediction_tables_ready = False
+
+        # Called with the table name after every write, used to drop cached responses
+        self.write_listeners = []
+
+        # Whole mlbstats table, kept with its numpy columns for server side chart summaries
+        # and a per-player index for the radar, line and stats grid endpoints
+        self.stats_table = None
+        self.stats_columns = None
+        self.player_profiles = None
+        self.stats_table_lock = threading.Lock()
+
+        # Loads by other workers or outside the app show up as a new row count or max year,
+        # the ttl catches in-place updates that change neither
+        self.stats_table_check_seconds = self.pool_options.get("stats_table_check_seconds", 60)
+        self.stats_table_ttl = self.pool_options.get("stats_table_ttl", 3600)
+        self.stats_table_signature = None
+        self.stats_table_loaded_at = None
+        self.stats_table_checked_at = None
+
+
+
+    def connect(self):
+        if self.engine is not None:
+            return self.engine
+
+        with self.engine_lock:
+            if self.engine is not None:
+                return self.engine
+
+            delay = self.connect_backoff
+            for attempt in range(1, self.connect_retries + 1):
+                engine = None
+                try:
+                    with METRICS.timer("db_connect_seconds", backend=self.backend.name):
+                        engine = sa.create_engine(
+                            self.backend.get_url(),
+                            poolclass=sa.pool.QueuePool,
+                            pool_size=self.pool_options.get("pool_size", 5),
+                            max_overflow=self.pool_options.get("max_overflow", 5),
+                            pool_timeout=self.pool_options.get("pool_timeout", 30),
+                            pool_recycle=self.pool_options.get("pool_recycle", 1800),
+                            pool_pre_ping=True,
+                            **self.backend.get_engine_options()
+                        )
+                        self.backend.prepare(engine)
+                        engine.connect().close()
+                    self.engine = engine
+                    return engine
+
+                except sa.exc.SQLAlchemyError:
+                    METRICS.inc("db_connect_failures_total", backend=self.backend.name)
+                    if engine is not None:
+                        engine.dispose()
+                    if attempt == self.connect_retries:
+                        raise
+                    time.sleep(delay)
+                    delay *= 2
+
+
+
+    def checkout(self):
+        engine = self.connect()
+        with self.pool_lock:
+            self.pool_stats["waiters"] += 1
+            self.pool_stats["max_waiters"] = max(self.pool_stats["max_waiters"], self.pool_stats["waiters"])
+
+        start = time.perf_counter()
         try:
-            self.engine = sa.create_engine(db2_conn_str)
-            self.conn = self.engine.connect()
-        except sa.exc.SQLAlchemyError as sa_err:
-            raise sa_err
+            conn = engine.connect()
+        finally:
+            waited = time.perf_counter() - start
+            with self.pool_lock:
+                self.pool_stats["waiters"] -= 1
+                self.pool_stats["wait_seconds"] += waited
+                self.pool_stats["max_wait_seconds"] = max(self.pool_stats["max_wait_seconds"], waited)
 
+        with self.pool_lock:
+            self.pool_stats["checkouts"] += 1
+        return conn
 
 
+
+    @contextmanager
+    def connection(self):
+        # Reuse the connection pinned by scope(), otherwise borrow one just for this call
+        conn = getattr(self.scoped, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+
+        conn = self.checkout()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+
+    @contextmanager
+    def scope(self):
+        if getattr(self.scoped, "conn", None) is not None:
+            yield self.scoped.conn
+            return
+
+        self.scoped.conn = self.checkout()
+        try:
+            yield self.scoped.conn
+        finally:
+            conn = self.scoped.conn
+            self.scoped.conn = None
+            conn.close()
+
+
+
+    @contextmanager
+    def transaction(self):
+        # Every DB2Connect call made inside the block commits or rolls back together
+        with self.scope() as conn:
+            if conn.in_transaction():
+                yield conn
+                return
+            self.scoped.pending_writes = set()
+            try:
+                with conn.begin():
+                    yield conn
+                pending = self.scoped.pending_writes
+            finally:
+                self.scoped.pending_writes = None
+
+            # Listeners only hear about writes once they are committed
+            for tblNm in pending:
+                self.notify_write(tblNm)
+
+
+
+    def read_frame(self, sql, params=None):
+        # Same frame read_sql builds, with the round-trip and the DataFrame build timed apart
+        method = METRICS.current_method()
+        with self.connection() as conn:
+            with METRICS.timer("db_stage_seconds", method=method, stage="query"):
+                result = conn.exec_driver_sql(sql, tuple(params or []))
+                columns = list(result.keys())
+                rows = result.fetchall()
+
+        with METRICS.timer("db_stage_seconds", method=method, stage="frame"):
+            df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+
+        METRICS.inc("db_rows_fetched_total", len(rows), method=method)
+        return df
+
+
+
+    def to_json(self, df):
+        with METRICS.timer("db_stage_seconds", method=METRICS.current_method(), stage="serialize"):
+            return df.to_json(orient='records')
+
+
+
+    def execute(self, sql, params=None):
+        with self.connection() as conn:
+            return conn.exec_driver_sql(sql, tuple(params or []))
+
+
+
+    def stream_records(self, sql, params=None, chunksize=1000, float_columns=()):
+        # Generator with its own connection, it outlives the request handler that created it.
+        # float_columns are integer columns with a NULL somewhere, read_sql makes them float for the whole
+        # result, so every chunk does too, including the chunks that happen to hold no NULL
+        conn = self.checkout()
+        try:
+            result = conn.execution_options(stream_results=True).exec_driver_sql(sql, tuple(params or []))
+            columns = list(result.keys())
+
+            yield '['
+            first = True
+            while True:
+                rows = result.fetchmany(chunksize)
+                if not rows:
+                    break
+
+                # Same frame construction as read_sql so each record serializes identically
+                df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+                for col in float_columns:
+                    if df[col].dtype.kind in "iu":
+                        df[col] = df[col].astype("float64")
+                chunk = df.to_json(orient='records')
+                METRICS.inc("db_rows_fetched_total", len(rows), method="stream_records")
+                yield chunk[1:-1] if first else ',' + chunk[1:-1]
+                first = False
+            yield ']'
+        finally:
+            conn.close()
+
+
+
+    def get_null_aliases(self, columns):
+        # {"alias": "MLBSTATS_COLUMN"} -> the aliases whose column holds a NULL, in one pass over mlbstats
+        sums = ", ".join(f'SUM(CASE WHEN {col} IS NULL THEN 1 ELSE 0 END) AS "{alias}"' for alias, col in columns.items())
+        row = self.read_frame(f"SELECT {sums} FROM mlbstats").iloc[0]
+        return [alias for alias in columns if pd.notna(row[alias]) and row[alias] > 0]
+
+
+
+    def get_pool_stats(self):
+        with self.pool_lock:
+            stats = dict(self.pool_stats)
+        stats["connected"] = self.engine is not None
+        if self.engine is None:
+            return stats
+
+        pool = self.engine.pool
+        stats["size"] = pool.size()
+        stats["checked_out"] = pool.checkedout()
+        stats["checked_in"] = pool.checkedin()
+        stats["overflow"] = pool.overflow()
+        return stats
+
+
+
+    def query_stats_schema(self):
+        return self.backend.query_stats_schema(self)
+
+
+
+    @METRICS.instrumented("db_method_seconds")
     def get_all_data(self, start_yr, end_yr):
+        if self.snapshots is not None:
+            return self.snapshots.get_range(start_yr, end_yr)
+        return self.query_all_data(start_yr, end_yr)
+
+
+
+    @METRICS.instrumented("db_method_seconds")
+    def query_all_data(self, start_yr, end_yr):
         params = [start_yr, end_yr]
         sql = "SELECT * FROM mlbstats WHERE mlb_year >= ? AND mlb_year <= ?"
-        return pd.read_sql(sql, con=self.conn, params=params)
+        return self.read_frame(sql, params)
 
 
 
-    def get_histogram_data(self, fieldNm):
+    @METRICS.instrumented("db_method_seconds")
+    def get_histogram_data(self, fieldNm, stream=False):
         
         # Ensure valid field name is requested
-        sql = "SELECT NAME AS field FROM SYSIBM.SYSCOLUMNS WHERE TBcreator = 'MLN78422' and TBNAME = 'MLBSTATS'"
-        fields = pd.read_sql(sql, con=self.conn)
-        if not fieldNm in fields['field'].values:
+        if not CATALOG.is_valid_field(fieldNm):
             return False
 
         # Now get data
         sql = f'SELECT \'histdata\' as "group", {fieldNm} as "value" from mlbstats'
-        return pd.read_sql(sql, con=self.conn).to_json(orient='records')
+        if stream:
+            return self.stream_records(sql, float_columns=self.get_null_aliases({"value": fieldNm}))
+        return self.to_json(self.read_frame(sql))
         
 
 
+    @METRICS.instrumented("db_method_seconds")
     def get_histogram_stats(self, fieldNm):
 
         # Ensure valid field name is requested
-        sql = "SELECT NAME AS field FROM SYSIBM.SYSCOLUMNS WHERE TBcreator = 'MLN78422' and TBNAME = 'MLBSTATS'"
-        fields = pd.read_sql(sql, con=self.conn)
-        if not fieldNm in fields['field'].values:
+        if not CATALOG.is_valid_field(fieldNm):
             return False
         
+        # Embedded backends without MEDIAN get the same numbers from the cached columns
+        if not self.backend.supports_median:
+            summary = summarize_column(self.get_stats_columns()[fieldNm.lower()], 1)
+            stats = {
+                "max": summary.get("max"),
+                "min": summary.get("min"),
+                "avg": summary.get("mean"),
+                "median": summary.get("median"),
+                "mode": summary.get("mode")
+            }
+            return json.dumps([stats])
+
         # Now get data
         sql = (
             f'SELECT MAX({fieldNm}) as "max", '
@@ -62,146 +343,137 @@ class DB2Connect:
 
             'from mlbstats'
         )
-        return pd.read_sql(sql, con=self.conn).to_json(orient='records')
+        return self.to_json(self.read_frame(sql))
 
 
 
-    def get_scatter_data(self, fieldNm):
+    @METRICS.instrumented("db_method_seconds")
+    def get_stats_table(self):
+        with self.stats_table_lock:
+            if self.stats_table is not None and self.stats_table_is_stale():
+                self.reset_stats_table()
+            if self.stats_table is None:
+                # Signature first, a load that lands in between is picked up by the next check
+                self.stats_table_signature = self.get_stats_signature()
+                self.stats_table = self.read_frame("SELECT * FROM mlbstats")
+                self.stats_table_loaded_at = self.stats_table_checked_at = time.monotonic()
+            return self.stats_table
 
-        # Ensure valid field name is requested
-        sql = "SELECT NAME AS field FROM SYSIBM.SYSCOLUMNS WHERE TBcreator = 'MLN78422' and TBNAME = 'MLBSTATS'"
-        fields = pd.read_sql(sql, con=self.conn)
-        if not fieldNm in fields['field'].values:
+
+
+    def stats_table_is_stale(self):
+        now = time.monotonic()
+        if now - self.stats_table_loaded_at >= self.stats_table_ttl:
+            return True
+        if now - self.stats_table_checked_at < self.stats_table_check_seconds:
             return False
+        self.stats_table_checked_at = now
+        return self.get_stats_signature() != self.stats_table_signature
 
-        # Now get data
-        sql = f'SELECT \'scatterdata\' as "group", XWOBA as "xwoba", {fieldNm} as "selectedField" FROM MLBSTATS'
-        return pd.read_sql(sql, con=self.conn).to_json(orient='records')
 
 
+    def get_stats_signature(self):
+        df = self.read_frame('SELECT COUNT(*) AS "n", MAX(MLB_YEAR) AS "max_year" FROM mlbstats')
+        return tuple(df.iloc[0].tolist())
 
-    def get_radar_player_data(self, player_id):
-        params = [player_id, player_id, player_id, player_id, player_id]
 
-        sql = (
-            'SELECT CONCAT(CONCAT(FIRST_NAME, \' \'), LAST_NAME) AS "player", '
-            '\'Home Runs\' AS "stat", '
-            'SUM(B_HOME_RUN)  AS "value" '
-            'FROM MLBSTATS '
-            'WHERE PLAYER_ID = ? '
-            'GROUP BY CONCAT(CONCAT(FIRST_NAME, \' \'), LAST_NAME), \'Home Runs\' '
 
-            'UNION '
-            'SELECT CONCAT(CONCAT(FIRST_NAME, \' \'), LAST_NAME) AS "player", '
-            '\'RBI\' AS "stat", '
-            'SUM(B_RBI)  AS "value" '
-            'FROM MLBSTATS '
-            'WHERE PLAYER_ID = ? '
-            'GROUP BY CONCAT(CONCAT(FIRST_NAME, \' \'), LAST_NAME), \'RBI\' '
+    def reset_stats_table(self):
+        # Caller holds stats_table_lock, the columns and profiles are rebuilt from the next table
+        self.stats_table = None
+        self.stats_columns = None
+        self.player_profiles = None
 
-            'UNION '
-            'SELECT CONCAT(CONCAT(FIRST_NAME, \' \'), LAST_NAME) AS "player", '
-            '\'Hits\' AS "stat", '
-            'SUM(B_TOTAL_HITS)  AS "value" '
-            'FROM MLBSTATS '
-            'WHERE PLAYER_ID = ? '
-            'GROUP BY CONCAT(CONCAT(FIRST_NAME, \' \'), LAST_NAME), \'Hits\' '
 
-            'UNION '
-            'SELECT CONCAT(CONCAT(FIRST_NAME, \' \'), LAST_NAME) AS "player", '
-            '\'Strikeouts\' AS "stat", '
-            'SUM(B_STRIKEOUT)  AS "value" '
-            'FROM MLBSTATS '
-            'WHERE PLAYER_ID = ? '
-            'GROUP BY CONCAT(CONCAT(FIRST_NAME, \' \'), LAST_NAME), \'Strikeouts\' '
 
-            'UNION '
-            'SELECT CONCAT(CONCAT(FIRST_NAME, \' \'), LAST_NAME) AS "player", '
-            '\'Walks\' AS "stat", '
-            'SUM(B_WALK) AS "value" '
-            'FROM MLBSTATS '
-            'WHERE PLAYER_ID = ? '
-            'GROUP BY CONCAT(CONCAT(FIRST_NAME, \' \'), LAST_NAME), \'Walks\' '
-        )
-        return pd.read_sql(sql, con=self.conn, params=params).to_json(orient='records')
+    def get_stats_columns(self):
+        stats_table = self.get_stats_table()
+        with self.stats_table_lock:
+            if self.stats_columns is None:
+                self.stats_columns = {col.lower(): stats_table[col].to_numpy() for col in stats_table.columns}
+            return self.stats_columns
 
 
 
-    def get_line_player_data(self, player_id):
-        params = [player_id, player_id, player_id, player_id, player_id]
-        sql = (
-            'SELECT \'xwOBA\' AS "group", '
-            'MLB_YEAR AS "key", '
-            'XWOBA AS "value" '
-            'FROM MLBSTATS '
-            'WHERE PLAYER_ID = ? '
+    def get_player_profiles(self):
+        stats_table = self.get_stats_table()
+        with self.stats_table_lock:
+            if self.player_profiles is None:
+                self.player_profiles = PlayerProfileStore(stats_table)
+            return self.player_profiles
 
-            'UNION '
-            'SELECT \'AVG\' AS "group", '
-            'MLB_YEAR AS "key", '
-            'BATTING_AVG AS "value" '
-            'FROM MLBSTATS '
-            'WHERE PLAYER_ID = ? '
 
-            'UNION '
-            'SELECT \'OPS\' AS "group", '
-            'MLB_YEAR AS "key", '
-            'ON_BASE_PLUS_SLG AS "value" '
-            'FROM MLBSTATS '
-            'WHERE PLAYER_ID = ? '
 
-            'UNION '
-            'SELECT \'SLG\' AS "group", '
-            'MLB_YEAR AS "key", '
-            'SLG_PERCENT AS "value" '
-            'FROM MLBSTATS '
-            'WHERE PLAYER_ID = ? '
+    @METRICS.instrumented("db_method_seconds")
+    def get_histogram_summary(self, fieldNms, bins=20, value_range=None, year=None, min_pa=None):
+        columns = self.get_stats_columns()
+        fieldNms = [f.lower() for f in fieldNms]
+        for fieldNm in fieldNms:
+            column = CATALOG.get_column(fieldNm)
+            if column is None or not column.is_numeric or fieldNm not in columns:
+                return False
+
+        mask = None
+        if year is not None:
+            mask = columns['mlb_year'].astype(int) == int(year)
+        if min_pa is not None:
+            pa_mask = columns['b_total_pa'] >= float(min_pa)
+            mask = pa_mask if mask is None else mask & pa_mask
+
+        summary = {}
+        for fieldNm in fieldNms:
+            values = columns[fieldNm] if mask is None else columns[fieldNm][mask]
+            summary[fieldNm.upper()] = summarize_column(values, bins, value_range)
+        return summary
 
-            'UNION '
-            'SELECT \'ISO\' AS "group", '
-            'MLB_YEAR AS "key", '
-            'ISOLATED_POWER AS "value" '
-            'FROM MLBSTATS '
-            'WHERE PLAYER_ID = ? '
-            'ORDER BY "key" '
-        )
-        return pd.read_sql(sql, con=self.conn, params=params).to_json(orient='records')
 
 
+    @METRICS.instrumented("db_method_seconds")
+    def get_scatter_data(self, fieldNm, stream=False):
+
+        # Ensure valid field name is requested
+        if not CATALOG.is_valid_field(fieldNm):
+            return False
+
+        # Now get data
+        sql = f'SELECT \'scatterdata\' as "group", XWOBA as "xwoba", {fieldNm} as "selectedField" FROM MLBSTATS'
+        if stream:
+            return self.stream_records(sql, float_columns=self.get_null_aliases({"xwoba": "XWOBA", "selectedField": fieldNm}))
+        return self.to_json(self.read_frame(sql))
+
+
+
+    @METRICS.instrumented("db_method_seconds")
+    def get_radar_player_data(self, player_id):
+        return self.get_player_json(player_id, self.get_player_profiles().get_radar_frame)
+
+
+
+    @METRICS.instrumented("db_method_seconds")
+    def get_line_player_data(self, player_id):
+        return self.get_player_json(player_id, self.get_player_profiles().get_line_frame)
 
+
+
+    @METRICS.instrumented("db_method_seconds")
     def get_player_data_all(self, player_id):
-        params = [player_id]
-        sql = (
-            'SELECT ROW_NUMBER() OVER() "ID", '
-            'MLB_YEAR AS "Year", '
-            'PLAYER_AGE AS "Age", '
-            'B_GAME AS "Games", '
-            'B_TOTAL_PA AS "Plate Appearances", '
-            'B_AB AS "At Bats", '
-            'B_TOTAL_HITS AS "Hits", '
-            'B_SINGLE AS "Singles", ' 
-            'B_DOUBLE AS "Doubles", ' 
-            'B_TRIPLE AS "Triples", ' 
-            'B_HOME_RUN AS "Home Runs", '
-            'B_RBI AS "Runs Batted In", '
-            'B_STRIKEOUT AS "Strikeouts", '
-            'B_WALK AS "Walks", ' 
-            'XWOBA AS "xwOBA", '
-            'BATTING_AVG AS "Batting AVG", '
-            'ON_BASE_PERCENT AS "On Base Perc", '
-            'SLG_PERCENT AS "Slugging Perc", '
-            'ON_BASE_PLUS_SLG AS "On Base Plus SLG", '
-            'ISOLATED_POWER AS "Isolated Power", '
-            'B_TOTAL_BASES AS "Total Bases" '
-            'FROM MLBSTATS '
-            'WHERE PLAYER_ID = ? '
-            'ORDER BY MLB_YEAR'
-        )
-        return pd.read_sql(sql, con=self.conn, params=params).to_json(orient='records')
+        return self.get_player_json(player_id, self.get_player_profiles().get_grid_frame)
+
+
+
+    def get_player_json(self, player_id, frame_fn):
+        # "a,b,c" compares several players in one call, keyed by player id
+        player_ids = [int(p) for p in str(player_id).split(',') if p.strip()]
+        if len(player_ids) == 1:
+            return self.to_json(frame_fn(player_ids[0]))
 
+        parts = [f'"{p}":' + self.to_json(frame_fn(p)) for p in player_ids]
+        return '{' + ','.join(parts) + '}'
 
 
-    def get_all_predicted_data(self):
+
+    @METRICS.instrumented("db_method_seconds")
+    def get_all_predicted_data(self, stream=False):
         sql = (
             'WITH Q1 AS '
                 '(select p.PLAYER_ID, '
@@ -235,70 +507,154 @@ class DB2Connect:
             'LEFT JOIN Q2 ON Q1.PLAYER_ID = Q2.PLAYER_ID '
             'ORDER BY Q1.XWOBA DESC'
         )
-        return pd.read_sql(sql, con=self.conn).to_json(orient='records')
-
+        # No integer column here can be NULL, the DECIMAL ones come back as floats either way
+        if stream:
+            return self.stream_records(sql)
+        return self.to_json(self.read_frame(sql))
 
 
-    def save_xgb_scores(self, scores, model_type):
-
-        # Delete current scores
-        params = [model_type]
-        sql = "DELETE FROM XGBOOST_SCORES WHERE MODEL_TYPE = ?"
-        self.engine.execute(sql, con=self.conn, *params)
-
-        #Insert new record with new score
-        params = [
-            model_type,
-            scores['training'],
-            scores['mean_cv'],
-            scores['kf_cv'],
-            scores['mse'],
-            scores['r2s'],
-            scores['explained_var']
-        ]
 
+    def get_predicted_filters(self, actual_year, predicted_year, name_prefix=None, models=None):
+        # Players predicted for actual_year with their actual season, plus the predicted_year prediction if there is one
         sql = (
-            "INSERT INTO XGBOOST_SCORES(MODEL_TYPE, TRAINING, MEAN_CV, KFOLD_CV_AVG, MSE, RSQUARED, EXPLAINED_VAR) "
-            "VALUES (?,?,?,?,?,?,?)"
+            'FROM player_predictions pp '
+            'INNER JOIN players p ON p.PLAYER_ID = pp.PLAYER_ID '
+            'INNER JOIN mlbstats m ON m.PLAYER_ID = pp.PLAYER_ID AND m.MLB_YEAR = ? '
+            'LEFT JOIN player_predictions nx ON nx.PLAYER_ID = pp.PLAYER_ID AND nx.MLB_YEAR = ? '
+            'WHERE pp.MLB_YEAR = ? '
         )
-        self.engine.execute(sql, con=self.conn, *params)
+        params = [int(actual_year), int(predicted_year), int(actual_year)]
+
+        if name_prefix:
+            # Prefix of the first name, the last name or "first last", case insensitive
+            pattern = name_prefix.upper().replace('!', '!!').replace('%', '!%').replace('_', '!_') + '%'
+            sql += (
+                "AND (UPPER(p.LAST_NAME) LIKE ? ESCAPE '!' "
+                "OR UPPER(p.FIRST_NAME) LIKE ? ESCAPE '!' "
+                "OR UPPER(TRIM(p.FIRST_NAME) || ' ' || TRIM(p.LAST_NAME)) LIKE ? ESCAPE '!') "
+            )
+            params += [pattern] * 3
+
+        if models:
+            sql += 'AND nx.MODEL IN (' + ','.join('?' * len(models)) + ') '
+            params += list(models)
+
+        return sql, params
+
+
+
+    @METRICS.instrumented("db_method_seconds")
+    def get_predicted_page(self, actual_year, predicted_year, sort="actual_xwoba", descending=True, limit=50, after=None, name_prefix=None, models=None):
+        # One page ordered by (sort, id), after is the (sort value, id) of the previous page's last row
+        if sort not in PREDICTED_STATS_COLUMNS:
+            raise ValueError("sort must be one of " + ", ".join(PREDICTED_STATS_COLUMNS))
+        expr, fill = PREDICTED_STATS_COLUMNS[sort]
+        sort_expr = expr if fill is None else f'COALESCE({expr}, {fill})'
+        direction = 'DESC' if descending else 'ASC'
+        op = '<' if descending else '>'
+
+        from_sql, params = self.get_predicted_filters(actual_year, predicted_year, name_prefix, models)
+        if after is not None:
+            if sort == "id":
+                from_sql += f'AND p.PLAYER_ID {op} ? '
+                params.append(after[1])
+            else:
+                from_sql += f'AND ({sort_expr} {op} ? OR ({sort_expr} = ? AND p.PLAYER_ID {op} ?)) '
+                params += [after[0], after[0], after[1]]
+
+        columns = ', '.join(f'{col_expr} AS "{key}"' for key, (col_expr, _) in PREDICTED_STATS_COLUMNS.items())
+        sql = (
+            f'SELECT {columns}, {sort_expr} AS "sort_key" '
+            + from_sql
+            + f'ORDER BY {sort_expr} {direction}, p.PLAYER_ID {direction} '
+            + f'LIMIT {int(limit) + 1}'
+        )
+        df = self.read_frame(sql, params)
 
+        # The extra row only says whether there is another page
+        last = None
+        if len(df.index) > limit:
+            df = df.iloc[:limit]
+            sort_value = df["sort_key"].iloc[-1]
+            last = (sort_value.item() if hasattr(sort_value, "item") else sort_value, int(df["id"].iloc[-1]))
+        return self.to_json(df.drop(columns="sort_key")), last
 
 
-    def save_xgb_hyperparams(self, hyper_params, model_type):
 
-        # Delete current scores
-        params = [model_type]
-        sql = "DELETE FROM XGBOOST_HYPERPARAMS WHERE MODEL_TYPE = ?"
-        self.engine.execute(sql, con=self.conn, *params)
-
-        # Insert new record with new score
-        params = [
-            model_type,
-            hyper_params['n_estimators'],
-            hyper_params['subsample'],
-            hyper_params['max_depth'],
-            hyper_params['learning_rate'],
-            hyper_params['gamma'],
-            hyper_params['reg_alpha'],
-            hyper_params['reg_lambda']
-        ]
-
-        sql = (
-            "INSERT INTO XGBOOST_HYPERPARAMS(MODEL_TYPE, N_ESTIMATORS, SUBSAMPLE, MAX_DEPTH, LEARNING_RATE, GAMMA, REG_ALPHA, REG_LAMBDA) "
-            "VALUES (?,?,?,?,?,?,?,?)"
-        )
-        self.engine.execute(sql, con=self.conn, *params)
+    @METRICS.instrumented("db_method_seconds")
+    def count_predicted_data(self, actual_year, predicted_year, name_prefix=None, models=None):
+        from_sql, params = self.get_predicted_filters(actual_year, predicted_year, name_prefix, models)
+        return int(self.read_frame('SELECT COUNT(*) AS "total" ' + from_sql, params)["total"].iloc[0])
 
 
 
+    @METRICS.instrumented("db_method_seconds")
+    def save_xgb_scores(self, scores, model_type):
+        with self.transaction():
+            # Delete current scores
+            params = [model_type]
+            sql = "DELETE FROM XGBOOST_SCORES WHERE MODEL_TYPE = ?"
+            self.execute(sql, params)
+
+            #Insert new record with new score
+            params = [
+                model_type,
+                scores['training'],
+                scores['mean_cv'],
+                scores['kf_cv'],
+                scores['mse'],
+                scores['r2s'],
+                scores['explained_var']
+            ]
+
+            sql = (
+                "INSERT INTO XGBOOST_SCORES(MODEL_TYPE, TRAINING, MEAN_CV, KFOLD_CV_AVG, MSE, RSQUARED, EXPLAINED_VAR) "
+                "VALUES (?,?,?,?,?,?,?)"
+            )
+            self.execute(sql, params)
+            self.notify_write("xgboost_scores")
+
+
+
+    @METRICS.instrumented("db_method_seconds")
+    def save_xgb_hyperparams(self, hyper_params, model_type):
+        with self.transaction():
+            # Delete current scores
+            params = [model_type]
+            sql = "DELETE FROM XGBOOST_HYPERPARAMS WHERE MODEL_TYPE = ?"
+            self.execute(sql, params)
+
+            # Insert new record with new score
+            params = [
+                model_type,
+                hyper_params['n_estimators'],
+                hyper_params['subsample'],
+                hyper_params['max_depth'],
+                hyper_params['learning_rate'],
+                hyper_params['gamma'],
+                hyper_params['reg_alpha'],
+                hyper_params['reg_lambda']
+            ]
+
+            sql = (
+                "INSERT INTO XGBOOST_HYPERPARAMS(MODEL_TYPE, N_ESTIMATORS, SUBSAMPLE, MAX_DEPTH, LEARNING_RATE, GAMMA, REG_ALPHA, REG_LAMBDA) "
+                "VALUES (?,?,?,?,?,?,?,?)"
+            )
+            self.execute(sql, params)
+            self.notify_write("xgboost_hyperparams")
+
+
+
+    @METRICS.instrumented("db_method_seconds")
     def delete_model_predictions_by_year(self, year):
         params = [year]
         sql = "DELETE FROM PLAYER_PREDICTIONS WHERE MLB_YEAR = ?"
-        self.engine.execute(sql, con=self.conn, *params)
+        self.execute(sql, params)
+        self.notify_write("player_predictions")
 
 
 
+    @METRICS.instrumented("db_method_seconds")
     def update_xgb_rsquared(self, model_type, year):
         params = [model_type, year, model_type]
         sql = (
@@ -306,9 +662,170 @@ class DB2Connect:
             'SET RSQUARED = (SELECT rsquared from XGBOOST_SCORES where model_type = ?) '
             'WHERE MLB_YEAR = ? and MODEL = ?'
         )
-        self.engine.execute(sql, con=self.conn, *params)
+        self.execute(sql, params)
+        self.notify_write("player_predictions")
+
+
+
+    @METRICS.instrumented("db_method_seconds")
+    def replace_year_predictions(self, df, year, model_type):
+        # Stage the rows first, then swap the year in one short transaction so readers
+        # see either the old predictions or the new ones, never an empty or partial year
+        start = time.perf_counter()
+        load_id, n_rows = self.stage_predictions(df, model_type)
+        staged = time.perf_counter()
+
+        try:
+            with self.transaction():
+                self.execute("DELETE FROM PLAYER_PREDICTIONS WHERE MLB_YEAR = ?", [year])
+                self.execute(
+                    "INSERT INTO PLAYER_PREDICTIONS(PLAYER_ID, MLB_YEAR, XWOBA_PREDICTED, RSQUARED, MODEL) "
+                    "SELECT PLAYER_ID, MLB_YEAR, XWOBA_PREDICTED, RSQUARED, MODEL "
+                    "FROM PLAYER_PREDICTIONS_STAGE WHERE LOAD_ID = ?",
+                    [load_id]
+                )
+                self.execute("DELETE FROM PLAYER_PREDICTION_FINGERPRINTS WHERE MLB_YEAR = ?", [year])
+                if 'FINGERPRINT' in df.columns:
+                    self.insert_fingerprints(df, year)
+                self.notify_write("player_predictions")
+        finally:
+            self.execute("DELETE FROM PLAYER_PREDICTIONS_STAGE WHERE LOAD_ID = ?", [load_id])
+
+        seconds = time.perf_counter() - start
+        METRICS.inc("db_rows_written_total", n_rows, table="player_predictions")
+        return {
+            "rows": n_rows,
+            "stage_seconds": staged - start,
+            "swap_seconds": seconds - (staged - start),
+            "seconds": seconds,
+            "rows_per_second": n_rows / seconds if seconds > 0 else None
+        }
+
+
+
+    @METRICS.instrumented("db_method_seconds")
+    def upsert_year_predictions(self, df, year, model_type):
+        # df holds every active player of an incremental run, only CHANGED rows are rewritten
+        # and players that dropped out of the year are removed
+        start = time.perf_counter()
+        changed = df[df['CHANGED']]
+        existing = self.read_frame("SELECT PLAYER_ID AS player_id FROM PLAYER_PREDICTIONS WHERE MLB_YEAR = ?", [year])
+        stale = sorted(set(existing['player_id'].astype(int)) - set(df['PLAYER_ID'].astype(int)))
+
+        if len(changed.index) == 0 and not stale:
+            return {"rows": 0, "removed": 0, "unchanged": len(df.index), "seconds": time.perf_counter() - start, "rows_per_second": None}
+
+        load_id, n_rows = self.stage_predictions(changed, model_type)
+        try:
+            with self.transaction():
+                self.execute(
+                    "DELETE FROM PLAYER_PREDICTIONS WHERE MLB_YEAR = ? AND PLAYER_ID IN "
+                    "(SELECT PLAYER_ID FROM PLAYER_PREDICTIONS_STAGE WHERE LOAD_ID = ?)",
+                    [year, load_id]
+                )
+                self.execute(
+                    "INSERT INTO PLAYER_PREDICTIONS(PLAYER_ID, MLB_YEAR, XWOBA_PREDICTED, RSQUARED, MODEL) "
+                    "SELECT PLAYER_ID, MLB_YEAR, XWOBA_PREDICTED, RSQUARED, MODEL "
+                    "FROM PLAYER_PREDICTIONS_STAGE WHERE LOAD_ID = ?",
+                    [load_id]
+                )
+                self.execute(
+                    "DELETE FROM PLAYER_PREDICTION_FINGERPRINTS WHERE MLB_YEAR = ? AND PLAYER_ID IN "
+                    "(SELECT PLAYER_ID FROM PLAYER_PREDICTIONS_STAGE WHERE LOAD_ID = ?)",
+                    [year, load_id]
+                )
+                self.insert_fingerprints(changed, year)
+
+                if stale:
+                    with self.connection() as conn:
+                        conn.exec_driver_sql("DELETE FROM PLAYER_PREDICTIONS WHERE MLB_YEAR = ? AND PLAYER_ID = ?", [(year, pid) for pid in stale])
+                        conn.exec_driver_sql("DELETE FROM PLAYER_PREDICTION_FINGERPRINTS WHERE MLB_YEAR = ? AND PLAYER_ID = ?", [(year, pid) for pid in stale])
+                self.notify_write("player_predictions")
+        finally:
+            self.execute("DELETE FROM PLAYER_PREDICTIONS_STAGE WHERE LOAD_ID = ?", [load_id])
+
+        seconds = time.perf_counter() - start
+        METRICS.inc("db_rows_written_total", n_rows, table="player_predictions")
+        return {
+            "rows": n_rows,
+            "removed": len(stale),
+            "unchanged": len(df.index) - n_rows,
+            "seconds": seconds,
+            "rows_per_second": n_rows / seconds if seconds > 0 else None
+        }
+
+
+
+    @METRICS.instrumented("db_method_seconds")
+    def get_prediction_fingerprints(self, year):
+        self.create_prediction_tables()
+        df = self.read_frame(
+            "SELECT PLAYER_ID AS player_id, FINGERPRINT AS fingerprint FROM PLAYER_PREDICTION_FINGERPRINTS WHERE MLB_YEAR = ?",
+            [year]
+        )
+        return dict(zip(df['player_id'].astype(int), df['fingerprint']))
+
+
+
+    def stage_predictions(self, df, model_type):
+        # Loads the rows under a fresh LOAD_ID, the caller swaps them in and clears the load
+        load_id = uuid.uuid4().hex
+        cols = ['PLAYER_ID', 'MLB_YEAR', 'XWOBA_PREDICTED', 'RSQUARED', 'MODEL']
+
+        df = df[cols].copy()
+        scores = self.read_frame("SELECT RSQUARED AS rsquared FROM XGBOOST_SCORES WHERE MODEL_TYPE = ?", [model_type])
+        if len(scores.index) > 0:
+            df.loc[df['MODEL'] == model_type, 'RSQUARED'] = scores['rsquared'].iloc[0]
+
+        values = [[None if pd.isnull(v) else v for v in df[col].tolist()] for col in cols]
+        rows = [(load_id, *row) for row in zip(*values)]
+
+        self.create_prediction_tables()
+        with self.connection() as conn:
+            with conn.begin():
+                for i in range(0, len(rows), 5000):
+                    conn.exec_driver_sql(
+                        "INSERT INTO PLAYER_PREDICTIONS_STAGE(LOAD_ID, PLAYER_ID, MLB_YEAR, XWOBA_PREDICTED, RSQUARED, MODEL) "
+                        "VALUES (?,?,?,?,?,?)",
+                        rows[i:i + 5000]
+                    )
+        return load_id, len(rows)
+
+
+
+    def insert_fingerprints(self, df, year):
+        rows = [(int(pid), year, fp) for pid, fp in zip(df['PLAYER_ID'], df['FINGERPRINT'])]
+        with self.connection() as conn:
+            for i in range(0, len(rows), 5000):
+                conn.exec_driver_sql(
+                    "INSERT INTO PLAYER_PREDICTION_FINGERPRINTS(PLAYER_ID, MLB_YEAR, FINGERPRINT) VALUES (?,?,?)",
+                    rows[i:i + 5000]
+                )
+
+
+
+    def create_prediction_tables(self):
+        if self.prediction_tables_ready:
+            return
+
+        metadata = sa.MetaData()
+        columns = [sa.Column(col, col_type) for col, col_type in self.get_table_datatypes("player_predictions").items()]
+        stage = sa.Table("player_predictions_stage", metadata, sa.Column("LOAD_ID", sa.types.VARCHAR(32)), *columns)
+        fingerprints = sa.Table(
+            "player_prediction_fingerprints",
+            metadata,
+            sa.Column("PLAYER_ID", sa.types.INTEGER),
+            sa.Column("MLB_YEAR", sa.types.SMALLINT),
+            sa.Column("FINGERPRINT", sa.types.VARCHAR(40))
+        )
+        with self.connection() as conn:
+            stage.create(conn, checkfirst=True)
+            fingerprints.create(conn, checkfirst=True)
+        self.prediction_tables_ready = True
+
 
 
+    @METRICS.instrumented("db_method_seconds")
     def get_prod_model_info(self):
         sql = (
             'SELECT n_estimators, '
@@ -328,19 +845,26 @@ class DB2Connect:
             'inner join xgboost_scores on xgboost_scores.model_type = xgboost_hyperparams.model_type '
             'where xgboost_hyperparams.model_type = \'prod_model\''
         )
-        return pd.read_sql(sql, con=self.conn).to_json(orient='records')
+        return self.to_json(self.read_frame(sql))
 
 
+    @METRICS.instrumented("db_method_seconds")
     def append_to_table(self, df, tblNm, if_exists):
-        df.to_sql(
-            tblNm,
-            self.engine,
-            if_exists=if_exists,
-            index=False,
-            chunksize=500,
-            method="multi",
-            dtype=self.get_table_datatypes(tblNm)
-        )
+        if self.snapshots is not None and tblNm.lower() == "mlbstats":
+            self.snapshots.invalidate()
+
+        with self.connection() as conn:
+            df.to_sql(
+                tblNm,
+                conn,
+                if_exists=if_exists,
+                index=False,
+                chunksize=500,
+                method="multi",
+                dtype=self.get_table_datatypes(tblNm)
+            )
+        METRICS.inc("db_rows_written_total", len(df.index), table=tblNm.lower())
+        self.notify_write(tblNm)
 
 
 
@@ -353,4 +877,18 @@ class DB2Connect:
                 "XWOBA_PREDICTED": sa.types.DECIMAL,
                 "RSQUARED": sa.types.REAL,
                 "MODEL": sa.types.VARCHAR(50)
-            }
\ No newline at end of file
+            }
+
+
+
+    def notify_write(self, tblNm):
+        pending = getattr(self.scoped, "pending_writes", None)
+        if pending is not None:
+            pending.add(tblNm)
+            return
+
+        if tblNm.lower() == "mlbstats":
+            with self.stats_table_lock:
+                self.reset_stats_table()
+        for listener in self.write_listeners:
+            listener(tblNm)
@@ -0,0 +1,144 @@
+import importlib
+import multiprocessing
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from mods.Metrics import METRICS
+
+
+class Executor:
+
+
+    def __init__(self, io_workers=10, cpu_workers=2):
+        # io: blocking driver calls on native threads, cpu: model work in spawned processes
+        self.workers = {"io": io_workers, "cpu": cpu_workers}
+        self.pools = {}
+        self.lock = threading.Lock()
+        self.stats = {pool: {"submitted": 0, "completed": 0, "failed": 0, "pending": 0, "max_pending": 0} for pool in self.workers}
+
+
+
+    def get_pool(self, pool):
+        # Built by the first call, after gunicorn has forked and gevent has patched the worker
+        if pool in self.pools:
+            return self.pools[pool]
+
+        with self.lock:
+            if pool not in self.pools:
+                if pool == "cpu":
+                    self.pools[pool] = ProcessPoolExecutor(self.workers["cpu"], mp_context=multiprocessing.get_context("spawn"))
+                elif gevent_active():
+                    # Real OS threads, a greenlet waiting on one yields to the hub instead of blocking it.
+                    # Tasks share patched locks (pool, metrics, catalog) with greenlets, needs gevent >= 20.12
+                    from gevent.threadpool import ThreadPool
+                    self.pools[pool] = ThreadPool(self.workers["io"])
+                else:
+                    self.pools[pool] = ThreadPoolExecutor(self.workers["io"])
+        return self.pools[pool]
+
+
+
+    def run_io(self, fn, *args, **kwargs):
+        submitted = time.perf_counter()
+        started = []
+
+        def call():
+            started.append(time.perf_counter())
+            return fn(*args, **kwargs)
+
+        pool = self.get_pool("io")
+        self.track("io", 1)
+        failed = False
+        try:
+            with METRICS.timer("executor_task_seconds", pool="io"):
+                if isinstance(pool, ThreadPoolExecutor):
+                    result = pool.submit(call).result()
+                else:
+                    result = pool.spawn(call).get()
+            METRICS.observe("executor_queue_wait_seconds", started[0] - submitted, pool="io")
+            return result
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.track("io", -1, failed)
+
+
+
+    def run_cpu(self, path, *args):
+        # path is "module:function", imported inside the child so this worker never loads it
+        if not self.workers["cpu"]:
+            return self.run_io(call_path, path, time.time(), args)[1]
+
+        pool = self.get_pool("cpu")
+        self.track("cpu", 1)
+        failed = False
+        try:
+            with METRICS.timer("executor_task_seconds", pool="cpu"):
+                waited, result = pool.submit(call_path, path, time.time(), args).result()
+            METRICS.observe("executor_queue_wait_seconds", waited, pool="cpu")
+            return result
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.track("cpu", -1, failed)
+
+
+
+    def iterate_io(self, gen):
+        # Streamed responses: each next() runs on the io pool, one at a time
+        done = object()
+        try:
+            while True:
+                item = self.run_io(next, gen, done)
+                if item is done:
+                    return
+                yield item
+        finally:
+            self.run_io(gen.close)
+
+
+
+    def track(self, pool, delta, failed=False):
+        # A finished task counts as either completed or failed, never both
+        with self.lock:
+            stats = self.stats[pool]
+            stats["pending"] += delta
+            if delta > 0:
+                stats["submitted"] += 1
+                stats["max_pending"] = max(stats["max_pending"], stats["pending"])
+            elif failed:
+                stats["failed"] += 1
+            else:
+                stats["completed"] += 1
+
+
+
+    def get_stats(self):
+        # queued is what is waiting for a free thread or process, pending includes the running ones
+        with self.lock:
+            stats = {pool: dict(s) for pool, s in self.stats.items()}
+        for pool, s in stats.items():
+            s["workers"] = self.workers[pool]
+            s["queued"] = max(0, s["pending"] - self.workers[pool])
+            s["started"] = pool in self.pools
+        return stats
+
+
+
+def gevent_active():
+    if "gevent.monkey" not in sys.modules:
+        return False
+    from gevent import monkey
+    return monkey.is_module_patched("threading")
+
+
+
+def call_path(path, submitted, args):
+    # Runs in the pool, returns how long the task queued alongside its result
+    waited = time.time() - submitted
+    module_nm, fn_nm = path.split(":")
+    fn = getattr(importlib.import_module(module_nm), fn_nm)
+    return waited, fn(*args)
@@ -0,0 +1,47 @@
+import numpy as np
+
+
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+
+def summarize_column(values, bins=20, value_range=None):
+    # Everything below is read off a single sort of the column
+    values = np.asarray(values, dtype=np.float64)
+    values = np.sort(values[~np.isnan(values)])
+    n = len(values)
+    if n == 0:
+        return {"n": 0, "edges": [], "counts": []}
+
+    lo, hi = value_range if value_range is not None else (values[0], values[-1])
+    if hi <= lo:
+        hi = lo + 1.0
+    edges = np.linspace(lo, hi, bins + 1)
+
+    # Same bins as np.histogram: right-open, except the last one which includes hi
+    positions = np.searchsorted(values, edges, side='left')
+    positions[-1] = np.searchsorted(values, edges[-1], side='right')
+    counts = np.diff(positions)
+
+    # Mode is the longest run of equal values, the smallest value wins ties
+    run_starts = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+    run_lengths = np.diff(np.append(run_starts, n))
+    mode = values[run_starts[np.argmax(run_lengths)]]
+
+    quantiles = np.quantile(values, QUANTILES)
+
+    return {
+        "n": int(n),
+        "edges": [round_value(e) for e in edges],
+        "counts": counts.tolist(),
+        "min": round_value(values[0]),
+        "max": round_value(values[-1]),
+        "mean": round_value(values.mean()),
+        "median": round_value(quantiles[QUANTILES.index(0.5)]),
+        "mode": round_value(mode),
+        "quantiles": {str(q): round_value(v) for q, v in zip(QUANTILES, quantiles)}
+    }
+
+
+
+def round_value(val):
+    return float(np.round(val, 6))
@@ -0,0 +1,188 @@
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import xgboost
+from sklearn.model_selection import train_test_split, KFold
+from sklearn.metrics import explained_variance_score, r2_score, mean_squared_error
+from mods.XGBCrossValidator import get_train_params, fit_fold
+
+
+# XGBRegressor defaults for anything the search space leaves out
+DEFAULT_HYPER_PARAMS = {
+    "n_estimators": 100,
+    "subsample": 1.0,
+    "max_depth": 6,
+    "learning_rate": 0.3,
+    "gamma": 0.0,
+    "reg_alpha": 0.0,
+    "reg_lambda": 1.0
+}
+
+INTEGER_PARAMS = {"n_estimators", "max_depth"}
+
+
+class HyperSearch:
+
+
+    def __init__(self, space, n_candidates=27, eta=3, n_splits=3, seed=0, max_workers=None, min_rounds=10, max_bin=256):
+        # Checked up front so a bad request fails before anything is streamed
+        for key in space:
+            if key not in DEFAULT_HYPER_PARAMS:
+                raise ValueError("Unknown hyperparameter " + key)
+        self.space = space
+        self.n_candidates = n_candidates
+        self.eta = eta
+        self.n_splits = n_splits
+        self.seed = seed
+        self.max_workers = max_workers or min(os.cpu_count() or 1, n_candidates)
+        self.min_rounds = min_rounds
+        self.max_bin = max_bin
+
+
+
+    def sample_candidates(self):
+        # Lists are choices, {"min", "max", "log"} objects are uniform or log-uniform ranges
+        rng = np.random.default_rng(self.seed)
+        candidates = []
+        for _ in range(self.n_candidates):
+            params = dict(DEFAULT_HYPER_PARAMS)
+            for key, spec in self.space.items():
+                params[key] = sample_value(rng, key, spec)
+            candidates.append(params)
+        return candidates
+
+
+
+    def prepare(self, x, y):
+        # Split and quantize once, every candidate and fold reuses the same bin codes
+        x_train, x_test, y_train, y_test = train_test_split(
+            np.ascontiguousarray(x, dtype=np.float32),
+            np.ascontiguousarray(y, dtype=np.float32).ravel(),
+            test_size=0.2,
+            random_state=self.seed
+        )
+        edges = quantile_edges(x_train, self.max_bin)
+        self.x_train = quantize(x_train, edges)
+        self.x_test = quantize(x_test, edges)
+        self.y_train = y_train
+        self.y_test = y_test
+        self.dtrain = xgboost.DMatrix(self.x_train, label=y_train)
+        self.kf_splits = list(KFold(n_splits=self.n_splits, shuffle=True, random_state=self.seed).split(x_train))
+        self.plain_splits = list(KFold(n_splits=self.n_splits).split(x_train))
+
+
+
+    def get_rungs(self):
+        # Fractions of each candidate's n_estimators, e.g. 1/9, 1/3, 1 for eta=3
+        n_rungs = max(1, int(math.floor(math.log(self.n_candidates, self.eta))) + 1)
+        return [self.eta ** (rung - n_rungs + 1) for rung in range(n_rungs)]
+
+
+
+    def evaluate(self, hyper_params, fraction, final):
+        start = time.perf_counter()
+        num_rounds = max(self.min_rounds, int(round(hyper_params["n_estimators"] * fraction)))
+        params = get_train_params(hyper_params, self.seed, max(1, (os.cpu_count() or 1) // self.max_workers))
+
+        kf_scores = [fit_fold(self.dtrain, self.y_train, tr, te, params, num_rounds, None)["score"] for tr, te in self.kf_splits]
+        mean_cv = None
+        if final:
+            mean_cv = float(np.mean([fit_fold(self.dtrain, self.y_train, tr, te, params, num_rounds, None)["score"] for tr, te in self.plain_splits]))
+
+        # Own DMatrix for the full fit, the shared one is only ever sliced across threads
+        booster = xgboost.train(params, xgboost.DMatrix(self.x_train, label=self.y_train), num_boost_round=num_rounds)
+        train_pred = booster.inplace_predict(self.x_train)
+        test_pred = booster.inplace_predict(self.x_test)
+
+        return {
+            "hyper_params": hyper_params,
+            "rounds": num_rounds,
+            "training": float(r2_score(self.y_train, train_pred)),
+            "mean_cv": mean_cv,
+            "kf_cv": float(np.mean(kf_scores)),
+            "mse": float(mean_squared_error(self.y_test, test_pred)),
+            "r2s": float(r2_score(self.y_test, test_pred)),
+            "explained_var": float(explained_variance_score(test_pred, self.y_test)),
+            "seconds": time.perf_counter() - start
+        }
+
+
+
+    def run(self, x, y):
+        # Generator of one leaderboard per rung, ranked on the shuffled k-fold score
+        self.prepare(x, y)
+        survivors, rung = self.sample_candidates(), 0
+        while survivors is not None:
+            event, survivors = self.run_rung(survivors, rung)
+            rung += 1
+            yield event
+
+
+
+    def run_rung(self, survivors, rung):
+        # One rung on its own thread pool, returns the rung event and the next rung's candidates,
+        # None after the last rung. Needs prepare() first
+        rungs = self.get_rungs()
+        fraction = rungs[rung]
+        final = rung == len(rungs) - 1
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results = list(pool.map(lambda params: self.evaluate(params, fraction, final), survivors))
+        results.sort(key=lambda r: r["kf_cv"], reverse=True)
+
+        keep = len(results) if final else max(1, len(results) // self.eta)
+        event = {
+            "event": "rung",
+            "rung": rung,
+            "seed": self.seed,
+            "rounds_fraction": fraction,
+            "candidates": len(results),
+            "kept": keep,
+            "seconds": time.perf_counter() - start,
+            "leaderboard": results
+        }
+        return event, None if final else [r["hyper_params"] for r in results[:keep]]
+
+
+
+def sample_value(rng, key, spec):
+    if isinstance(spec, list):
+        value = spec[int(rng.integers(len(spec)))]
+    elif isinstance(spec, dict):
+        lo, hi = float(spec["min"]), float(spec["max"])
+        if spec.get("log"):
+            value = float(np.exp(rng.uniform(np.log(lo), np.log(hi))))
+        else:
+            value = float(rng.uniform(lo, hi))
+    else:
+        value = spec
+
+    if key in INTEGER_PARAMS:
+        return int(round(value))
+    return float(value)
+
+
+
+def quantile_edges(x, max_bin):
+    # Per column cut points, at most max_bin - 1 of them
+    qs = np.linspace(0, 1, max_bin + 1)[1:-1]
+    edges = []
+    for col in range(x.shape[1]):
+        values = x[:, col]
+        values = values[~np.isnan(values)]
+        edges.append(np.unique(np.quantile(values, qs)) if len(values) else np.empty(0))
+    return edges
+
+
+
+def quantize(x, edges):
+    # Bin codes as float32 so xgboost sees a few hundred distinct values per column, NaN stays missing
+    codes = np.empty(x.shape, dtype=np.float32)
+    for col, cuts in enumerate(edges):
+        values = x[:, col]
+        codes[:, col] = np.searchsorted(cuts, values, side="right")
+        codes[np.isnan(values), col] = np.nan
+    return codes
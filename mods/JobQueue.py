@@ -0,0 +1,212 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobQueue:
+
+
+    def __init__(self, db_path, max_workers=2, logger=None, lease_seconds=120):
+        self.db_path = db_path
+
+        # Greenlets under the gevent worker, so handlers must hand heavy DB and model work
+        # to the Executor pools (app.run_db / run_predictor) instead of computing on this pool
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.handlers = {}
+        self.logger = logger
+        self.pid = os.getpid()
+        self.create_table()
+
+        # A job belongs to whoever keeps renewing its updated_at, PIDs are reused after a restart
+        self.lease_seconds = lease_seconds
+        self.active = set()
+        self.active_lock = threading.Lock()
+        self.stopped = threading.Event()
+        threading.Thread(target=self.heartbeat, name="job-lease-heartbeat", daemon=True).start()
+
+
+
+    @contextmanager
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+
+    def create_table(self):
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, "
+                "kind TEXT NOT NULL, "
+                "dedupe_key TEXT NOT NULL, "
+                "params TEXT NOT NULL, "
+                "status TEXT NOT NULL, "
+                "progress_done INTEGER, "
+                "progress_total INTEGER, "
+                "result TEXT, "
+                "error TEXT, "
+                "owner_pid INTEGER, "
+                "created_at REAL, "
+                "updated_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_dedupe ON jobs(dedupe_key, status)")
+
+
+
+    def register(self, kind, handler):
+        # handler(params, progress) returns something json serializable
+        self.handlers[kind] = handler
+
+
+
+    def submit(self, kind, params, dedupe_key):
+        now = time.time()
+        with self.connect() as conn:
+            # IMMEDIATE takes the write lock so two workers cannot both insert the same job
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT job_id, kind, params, updated_at FROM jobs WHERE dedupe_key = ? AND status IN (?, ?) ORDER BY created_at LIMIT 1",
+                (dedupe_key, *ACTIVE_STATUSES)
+            ).fetchone()
+            if row is not None and row["updated_at"] >= now - self.lease_seconds:
+                conn.execute("COMMIT")
+                return {"job_id": row["job_id"], "deduplicated": True}
+
+            # Its worker stopped renewing the lease, take the job over instead of pointing at a dead one
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET owner_pid = ?, status = 'queued', updated_at = ? WHERE job_id = ?",
+                    (self.pid, now, row["job_id"])
+                )
+                conn.execute("COMMIT")
+                self.start(row["job_id"], row["kind"], json.loads(row["params"]))
+                return {"job_id": row["job_id"], "deduplicated": True, "reclaimed": True}
+
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs(job_id, kind, dedupe_key, params, status, owner_pid, created_at, updated_at) "
+                "VALUES (?,?,?,?,?,?,?,?)",
+                (job_id, kind, dedupe_key, json.dumps(params), "queued", self.pid, now, now)
+            )
+            conn.execute("COMMIT")
+
+        self.start(job_id, kind, params)
+        return {"job_id": job_id, "deduplicated": False}
+
+
+
+    def start(self, job_id, kind, params):
+        with self.active_lock:
+            self.active.add(job_id)
+        self.pool.submit(self.run_job, job_id, kind, params)
+
+
+
+    def run_job(self, job_id, kind, params):
+        self.update(job_id, status="running")
+
+        # Every progress call also renews the lease
+        def progress(done, total):
+            self.update(job_id, progress_done=int(done), progress_total=int(total))
+
+        try:
+            result = self.handlers[kind](params, progress)
+            self.update(job_id, status="done", result=json.dumps(result))
+        except Exception as e:
+            if self.logger is not None:
+                self.logger.error(e)
+            self.update(job_id, status="failed", error=repr(e))
+        finally:
+            with self.active_lock:
+                self.active.discard(job_id)
+
+
+
+    def heartbeat(self):
+        # Renews the leases this worker holds, then reclaims expired ones from workers that died
+        while not self.stopped.wait(self.lease_seconds / 4):
+            try:
+                self.renew_leases()
+                self.recover()
+            except Exception as e:
+                if self.logger is not None:
+                    self.logger.error(e)
+
+
+
+    def renew_leases(self):
+        with self.active_lock:
+            job_ids = list(self.active)
+        if not job_ids:
+            return
+        with self.connect() as conn:
+            conn.execute(
+                f"UPDATE jobs SET updated_at = ? WHERE status IN (?, ?) AND job_id IN ({','.join('?' * len(job_ids))})",
+                (time.time(), *ACTIVE_STATUSES, *job_ids)
+            )
+
+
+
+    def update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self.connect() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+
+
+
+    def get_job(self, job_id):
+        with self.connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+
+
+    def recover(self):
+        # Queued or running jobs nobody has renewed within the lease, whatever PID they were started by
+        now = time.time()
+        recovered = []
+        with self.connect() as conn:
+            rows = conn.execute(
+                "SELECT job_id, kind, params, updated_at FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (*ACTIVE_STATUSES, now - self.lease_seconds)
+            ).fetchall()
+
+        for row in rows:
+            if row["kind"] not in self.handlers:
+                continue
+            with self.active_lock:
+                if row["job_id"] in self.active:
+                    continue
+
+            # Matching on the old updated_at means only one worker wins the claim
+            with self.connect() as conn:
+                claimed = conn.execute(
+                    "UPDATE jobs SET owner_pid = ?, status = 'queued', updated_at = ? WHERE job_id = ? AND updated_at = ? AND status IN (?, ?)",
+                    (self.pid, now, row["job_id"], row["updated_at"], *ACTIVE_STATUSES)
+                ).rowcount
+            if claimed:
+                self.start(row["job_id"], row["kind"], json.loads(row["params"]))
+                recovered.append(row["job_id"])
+
+        return recovered
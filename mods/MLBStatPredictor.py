@@ -2,12 +2,21 @@ import pandas as pd
 import numpy as np
 from sklearn.preprocessing import PolynomialFeatures
 from sklearn.linear_model import LinearRegression
-from sklearn.model_selection import train_test_split, cross_val_score, KFold
+from sklearn.model_selection import train_test_split
 from sklearn.metrics import explained_variance_score, r2_score, mean_squared_error
 import xgboost
-import pickle
+import hashlib
 import os
+from mods.ModelRegistry import MODEL_REGISTRY
+from mods.XGBCrossValidator import XGBCrossValidator, TREE_METHOD
+from mods.HyperSearch import HyperSearch
+from mods.SchemaCatalog import CATALOG
+from mods.Metrics import METRICS
+from mods.ModelArtifact import save_artifact
+from mods.PlayerFeatureStore import PlayerFeatureStore
 
+# Part of every polynomial fingerprint, bump it when fit_polynomial_batch changes its output
+POLY_MODEL_VERSION = "sklearn:1"
 
 class MLBStatPredictor:
 
@@ -19,8 +28,8 @@ class MLBStatPredictor:
 
     def create_and_predict_lin_reg(self, df, deg, year):
 
-        x = df.iloc[:, 3:4].values      # year
-        y = df.iloc[:, 28:29].values    # last col is target feature
+        x = df[['mlb_year']].values
+        y = df[[self.target]].values
 
         poly_reg = PolynomialFeatures(degree=deg)
         x_poly = poly_reg.fit_transform(x)
@@ -38,22 +47,30 @@ class MLBStatPredictor:
     
 
 
-    def create_xgboost_model(self, df, model_type, hyper_params):
+    def create_xgboost_model(self, df, model_type, hyper_params, seed=None, cv_options=None):
 
-        features = df.iloc[:,4:28].columns.tolist()
+        features = CATALOG.feature_names()
         target = self.target
 
         x = df[features]
         y = df[target].values
 
-        X_train, X_test, y_train, y_test = train_test_split(x, y ,test_size=0.2)
-        xgb = xgboost.XGBRegressor(**hyper_params)
-        xgb.fit(X_train,y_train)
+        # Keep the seed so any run can be reproduced
+        if seed is None:
+            seed = int(np.random.randint(0, 2**31 - 1))
+
+        X_train, X_test, y_train, y_test = train_test_split(x, y ,test_size=0.2, random_state=seed)
+        xgb = xgboost.XGBRegressor(**hyper_params, random_state=seed, tree_method=TREE_METHOD)
+        with METRICS.timer("training_stage_seconds", stage="fit"):
+            xgb.fit(X_train,y_train)
 
         # Training scores
         training_score = xgb.score(X_train, y_train)
-        mean_cv_score = cross_val_score(xgb, X_train, y_train,cv=10).mean()
-        kf_cv_scores = cross_val_score(xgb, X_train, y_train, cv=KFold(n_splits=10, shuffle=True)).mean()
+        cv = XGBCrossValidator(hyper_params, seed=seed, **(cv_options or {}))
+        with METRICS.timer("training_stage_seconds", stage="cross_validation"):
+            cv_scores = cv.run(X_train.values, y_train)
+        mean_cv_score = cv_scores["mean_cv"]
+        kf_cv_scores = cv_scores["kf_cv"]
 
         # Testing scores
         predictions = xgb.predict(X_test)
@@ -61,33 +78,61 @@ class MLBStatPredictor:
         r2s = r2_score(y_test, predictions)
         explained_var_score = explained_variance_score(predictions,y_test)
 
-        # Save model
-        # commented out for now to avoid user contention
-        # and can possibly be an enhancement in a future iteration
-        #self.xgboost_save_model(xgb, model_type)
-
-        return {
+        scores = {
             "training": training_score,
             "mean_cv": mean_cv_score,
             "kf_cv": kf_cv_scores,
             "mse": mse,
             "r2s": r2s,
-            "explained_var": explained_var_score
+            "explained_var": explained_var_score,
+            "seed": seed,
+            "cv_folds": cv_scores["folds"],
+            "cv_seconds": cv_scores["seconds"]
         }
 
+        # Save model
+        # commented out for now to avoid user contention
+        # and can possibly be an enhancement in a future iteration
+        #train_years = [int(df['mlb_year'].min()), int(df['mlb_year'].max())]
+        #self.xgboost_save_model(xgb, model_type, hyper_params, scores, train_years)
+
+        return scores
+
+
+
+    def search_xgboost_model(self, df, space, seed=None, search_options=None):
+        # Generator of per-rung leaderboards, nothing is saved here
+        x = df[CATALOG.feature_names()].values
+        y = df[self.target].values
+
+        if seed is None:
+            seed = int(np.random.randint(0, 2**31 - 1))
+
+        search = HyperSearch(space, seed=seed, **(search_options or {}))
+        return search.run(x, y)
+
+
+
+    def search_xgboost_rung(self, df, space, seed, search_options, survivors, rung):
+        # One rung of search_xgboost_model for the executor's process pool, survivors None samples the
+        # first rung. Every call splits and quantizes the same way, so the rungs match a single run
+        search = HyperSearch(space, seed=seed, **(search_options or {}))
+        search.prepare(df[CATALOG.feature_names()].values, df[self.target].values)
+        return search.run_rung(search.sample_candidates() if survivors is None else survivors, rung)
+
 
 
-    def xgboost_save_model(self, xgb, fileNm):
-        file_path = self.dir_path + '/' + fileNm + '.pkl'
-        pickle.dump(xgb, open(file_path, "wb"))
+    def xgboost_save_model(self, xgb, fileNm, hyper_params=None, scores=None, train_years=None):
+        # Native UBJSON booster plus a JSON sidecar with features, params and scores
+        return save_artifact(xgb, self.dir_path, fileNm, CATALOG.feature_names(), hyper_params, scores, train_years)
 
 
 
     def xgboost_predict(self, stats, fileNm, age=None):
-        file_path = self.dir_path + '/' + fileNm + '.pkl'
-        xgb_model = pickle.load(open(file_path, "rb"))
+        xgb_model = MODEL_REGISTRY.get_model(fileNm)
         pred = np.array([self.format_player_stats(stats, age)])
-        predicted = xgb_model.predict(pred)
+        with METRICS.timer("model_predict_seconds", model=fileNm, kind="single"):
+            predicted = xgb_model.predict(pred)
         return str(predicted[0])
 
 
@@ -95,58 +140,249 @@ class MLBStatPredictor:
     def format_player_stats(self, stats, age=None):
         formatted_stats = []
 
-        if age is None:
-            formatted_stats.append(stats["player_age"])
-        else:
-            formatted_stats.append(age)
-        
-        formatted_stats.append(stats["b_ab"])
-        formatted_stats.append(stats["b_total_pa"])
-        formatted_stats.append(stats["b_total_hits"])
-        formatted_stats.append(stats["b_single"])
-        formatted_stats.append(stats["b_double"])
-        formatted_stats.append(stats["b_triple"])
-        formatted_stats.append(stats["b_home_run"])
-        formatted_stats.append(stats["b_strikeout"])
-        formatted_stats.append(stats["b_walk"])
-        formatted_stats.append(stats["b_k_percent"])
-        formatted_stats.append(stats["b_bb_percent"])
-        formatted_stats.append(stats["batting_avg"])
-        formatted_stats.append(stats["slg_percent"])
-        formatted_stats.append(stats["on_base_percent"])
-        formatted_stats.append(stats["on_base_plus_slg"])
-        formatted_stats.append(stats["isolated_power"])
-        formatted_stats.append(stats["b_rbi"])
-        formatted_stats.append(stats["b_total_bases"])
-        formatted_stats.append(stats["b_ab_scoring"])
-        formatted_stats.append(stats["b_game"])
-        formatted_stats.append(stats["b_hit_line_drive"])
-        formatted_stats.append(stats["b_hit_popup"])
-        formatted_stats.append(stats["b_played_dh"])
+        for col in CATALOG.feature_names():
+            if col == "player_age" and age is not None:
+                formatted_stats.append(age)
+            else:
+                formatted_stats.append(stats[col])
 
         return formatted_stats
 
 
 
-    def generate_predictions(self, df, year, model_type, xgb_only):
-        df_unique = df[['last_name', 'first_name', 'player_id']].drop_duplicates()
-        df_final_predictions = pd.DataFrame(columns=['PLAYER_ID', 'MLB_YEAR', 'XWOBA_PREDICTED', 'RSQUARED' ,'MODEL'])
-        
-        for index, row in df_unique.iterrows():
-            df_player = df[(df['player_id'] == row['player_id'])]
-            max_year = df_player['mlb_year'].max()
-            if year - max_year > 2:     # Most likely the player has retired if this conditin is true
-                continue
-            
-            if len(df_player.index) < 3 or xgb_only:
-                prediction = self.predict_player_xgboost(df_player, model_type)
-                df_final_predictions.loc[len(df_final_predictions)] = [row['player_id'], year, prediction, None, model_type]
-            else:
-                prediction = self.predict_player_sklearn(df_player, year)
-                df_final_predictions.loc[len(df_final_predictions)] = [row['player_id'], year, prediction['predicted'], prediction['score'], 'sklearn']
+    def format_player_stats_batch(self, rows, ages=None):
+        # Returns a float32 matrix for the valid rows, their positions and per-row errors
+        if isinstance(rows, dict):
+            matrix = self.format_columnar_stats(rows, ages)
+            if matrix is not None:
+                return matrix, list(range(len(matrix))), {}
+            n_rows = len(next(iter(rows.values()), []))
+            rows = [{k: v[i] for k, v in rows.items() if i < len(v)} for i in range(n_rows)]
+
+        if ages is not None and len(ages) != len(rows):
+            raise ValueError(f"ages has {len(ages)} entries for {len(rows)} players")
+
+        features = CATALOG.feature_names()
+        matrix = np.empty((len(rows), len(features)), dtype=np.float32)
+        valid_idx = []
+        errors = {}
+
+        for i, stats in enumerate(rows):
+            try:
+                if not isinstance(stats, dict):
+                    raise ValueError("Row must be an object of player stats")
+                values = np.asarray(self.format_player_stats(stats, None if ages is None else ages[i]), dtype=np.float32)
+
+                # Same rule as the columnar path, missing or non-finite values are rejected rather than predicted on
+                bad = np.flatnonzero(~np.isfinite(values))
+                if len(bad) > 0:
+                    errors[i] = f"Field {features[bad[0]]} is missing or not a finite number"
+                    continue
+
+                matrix[len(valid_idx)] = values
+                valid_idx.append(i)
+            except KeyError as e:
+                errors[i] = f"Missing field {e.args[0]}"
+            except (TypeError, ValueError) as e:
+                errors[i] = repr(e)
+
+        return matrix[:len(valid_idx)], valid_idx, errors
+
+
+
+    def format_columnar_stats(self, columns, ages=None):
+        # Fast path for {"field": [values...]} payloads, None (ragged columns or any non-finite value)
+        # means fall back to the per-row checks, which report which rows were rejected
+        try:
+            features = CATALOG.feature_names()
+            lengths = {len(columns[col]) for col in features}
+            if len(lengths) != 1:
+                return None
+
+            matrix = np.empty((lengths.pop(), len(features)), dtype=np.float32)
+            for j, col in enumerate(features):
+                matrix[:, j] = np.asarray(columns[col], dtype=np.float32)
+            if ages is not None:
+                matrix[:, features.index("player_age")] = np.asarray(ages, dtype=np.float32)
+
+            return matrix if np.isfinite(matrix).all() else None
+
+        except (KeyError, TypeError, ValueError):
+            return None
+
+
+
+    def xgboost_predict_batch(self, rows, fileNm, ages=None):
+        matrix, valid_idx, errors = self.format_player_stats_batch(rows, ages)
+        n_rows = len(valid_idx) + len(errors)
+        results = [None] * n_rows
+
+        if len(valid_idx) > 0:
+            xgb_model = MODEL_REGISTRY.get_model(fileNm)
+            with METRICS.timer("model_predict_seconds", model=fileNm, kind="batch"):
+                predicted = xgb_model.predict(matrix)
+            for pos, i in enumerate(valid_idx):
+                results[i] = {"index": i, "predicted xwOBA": str(predicted[pos])}
+
+        for i, err in errors.items():
+            results[i] = {"index": i, "errorMsg": err}
+
+        return results
+
+
+
+    def generate_predictions(self, df, year, model_type, xgb_only, progress=None, previous=None):
+        # Players are contiguous row blocks of one float64 matrix, sorted by player_id
+        store = PlayerFeatureStore(df, list(dict.fromkeys(['mlb_year', self.target] + CATALOG.feature_names())))
+        player_ids = store.player_ids
+        n_players = len(store)
+        counts = store.counts
+
+        active = (year - store.latest_years()) <= 2    # Most likely the player has retired if this is false
+
+        use_xgb = active & ((counts < 3) | bool(xgb_only))
+        fingerprints = self.get_player_fingerprints(store, year, use_xgb, model_type)
+
+        # Incremental run: previous maps player_id -> stored fingerprint, only new or changed players are recomputed
+        changed = active.copy()
+        if previous is not None:
+            changed &= np.array([previous.get(int(pid)) != fp for pid, fp in zip(player_ids, fingerprints)], dtype=bool)
+
+        use_poly = changed & ~use_xgb
+        use_xgb = changed & use_xgb
+
+        predicted = np.full(n_players, np.nan)
+        rsquared = np.full(n_players, np.nan)
+        models = np.where(use_xgb, model_type, 'sklearn').astype(object)
+        n_changed = int(changed.sum())
+        if progress is not None:
+            progress(0, n_changed)
+
+        if use_poly.any():
+            row_mask = use_poly[store.row_players]
+            group_idx = np.cumsum(use_poly) - 1
+            with METRICS.timer("prediction_stage_seconds", stage="polynomial"):
+                poly = self.fit_polynomial_batch(
+                    group_idx[store.row_players[row_mask]],
+                    store.years.astype(np.float64)[row_mask],
+                    store.values[row_mask, store.col_index[self.target]],
+                    int(use_poly.sum()),
+                    year
+                )
+            predicted[use_poly] = poly["predicted"]
+            rsquared[use_poly] = poly["score"]
+            if progress is not None:
+                progress(int(use_poly.sum()), n_changed)
+
+        if use_xgb.any():
+            predicted[use_xgb] = self.predict_players_xgboost(store, use_xgb, model_type)
+        if progress is not None:
+            progress(n_changed, n_changed)
+
+        # Every active player is returned, CHANGED marks the rows that were actually recomputed
+        return pd.DataFrame({
+            'PLAYER_ID': player_ids[active],
+            'MLB_YEAR': year,
+            'XWOBA_PREDICTED': predicted[active],
+            'RSQUARED': rsquared[active],
+            'MODEL': models[active],
+            'FINGERPRINT': fingerprints[active],
+            'CHANGED': changed[active]
+        })
+
+
+
+    def get_player_fingerprints(self, store, year, use_xgb, model_type):
+        # sha1 of a player's input rows in season order, the target year and the model that predicts them
+        xgb_version = None
+        if use_xgb.any():
+            xgb_version = "xgb:" + model_type + ":" + MODEL_REGISTRY.get_version(model_type)
+
+        prefixes = {
+            True: f"{year}|{xgb_version}|".encode(),
+            False: f"{year}|{POLY_MODEL_VERSION}|".encode()
+        }
+        # The store's float64 rows, so an int column turning float (one NULL, snapshot vs DB frames)
+        # keeps every fingerprint. One NaN bit pattern and +0.0 for -0.0
+        values = np.ascontiguousarray(store.values)
+        values = np.where(np.isnan(values), np.nan, values + 0.0)
+        raw = memoryview(values.tobytes())
+        row_bytes = values.shape[1] * values.itemsize
+        offsets = (store.offsets * row_bytes).tolist()
+
+        fingerprints = np.empty(len(store), dtype=object)
+        for idx, xgb in enumerate(use_xgb.tolist()):
+            digest = hashlib.sha1(prefixes[xgb])
+            digest.update(raw[offsets[idx]:offsets[idx + 1]])
+            fingerprints[idx] = digest.hexdigest()
+        return fingerprints
+
+
+
+    def fit_polynomial_batch(self, codes, x, y, n_groups, year, degrees=(1, 2, 3)):
+        # Same fits as create_and_predict_lin_reg for every group at once: rows are padded
+        # into a (groups, rows, terms) stack and solved with a batched min-norm lstsq
+        counts = np.bincount(codes, minlength=n_groups)
+        order = np.argsort(codes, kind='stable')
+        sorted_codes = codes[order]
+        starts = np.cumsum(counts) - counts
+        pos = np.arange(len(codes)) - starts[sorted_codes]
+
+        mask = np.zeros((n_groups, counts.max()))
+        mask[sorted_codes, pos] = 1.0
+        x_pad = np.zeros_like(mask)
+        x_pad[sorted_codes, pos] = x[order]
+        y_pad = np.zeros_like(mask)
+        y_pad[sorted_codes, pos] = y[order]
+
+        n = counts.astype(np.float64)
+        y_mean = y_pad.sum(axis=1) / n
+        y_c = (y_pad - y_mean[:, None]) * mask
+        ss_tot = (y_c ** 2).sum(axis=1)
+
+        preds = np.empty((len(degrees), n_groups))
+        scores = np.empty((len(degrees), n_groups))
+
+        for d_idx, deg in enumerate(degrees):
+            # PolynomialFeatures terms including the bias column, centered like LinearRegression does
+            terms = x_pad[:, :, None] ** np.arange(deg + 1)
+            terms_mean = (terms * mask[:, :, None]).sum(axis=1) / n[:, None]
+            terms_c = (terms - terms_mean[:, None, :]) * mask[:, :, None]
+
+            coef = np.matmul(
+                np.linalg.pinv(terms_c, rcond=np.finfo(np.float64).eps),
+                y_c[:, :, None]
+            )[:, :, 0]
+            intercept = y_mean - (terms_mean * coef).sum(axis=1)
+
+            target_terms = float(year) ** np.arange(deg + 1)
+            preds[d_idx] = coef @ target_terms + intercept
+
+            fitted = (terms * coef[:, None, :]).sum(axis=2) + intercept[:, None]
+            ss_res = (((y_pad - fitted) * mask) ** 2).sum(axis=1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                scores[d_idx] = np.where(ss_tot > 0, 1 - ss_res / ss_tot, np.where(ss_res > 0, 0.0, 1.0))
+
+        # Pick the degree whose prediction lands closest to the player's mean, first one wins ties
+        best = np.argmin(np.abs(preds - y_mean[None, :]), axis=0)
+        cols = np.arange(n_groups)
+
+        return {
+            "predicted": preds[best, cols],
+            "score": scores[best, cols]
+        }
+
+
+
+    def predict_players_xgboost(self, store, player_mask, model_type):
+        feature_names = CATALOG.feature_names()
+        features = store.group_means(feature_names, player_mask).astype(np.float32)
+        features[:, feature_names.index("player_age")] = store.group_max("player_age", player_mask) + 1
+
+        xgb_model = MODEL_REGISTRY.get_model(model_type)
+        with METRICS.timer("model_predict_seconds", model=model_type, kind="players"):
+            return xgb_model.predict(np.ascontiguousarray(features))
 
-        return df_final_predictions
-    
 
 
     def predict_player_sklearn(self, df, year):
@@ -167,6 +403,12 @@ class MLBStatPredictor:
 
     def predict_player_xgboost(self, df, model_type):
         age = df['player_age'].max() + 1
-        dict_mean_vals = df.mean().to_dict()
+        dict_mean_vals = df[CATALOG.feature_names()].mean().to_dict()
         return self.xgboost_predict(dict_mean_vals, model_type, age)
 
+
+
+def run_method(target, method, columns, *args):
+    # Executor process pool entry point, the child has no database so it takes the worker's catalog columns
+    CATALOG.set_columns(columns)
+    return getattr(MLBStatPredictor(target), method)(*args)
@@ -0,0 +1,253 @@
+import functools
+import glob
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Starts at 10us so in-process model predictions still land in distinct buckets
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class Metrics:
+
+
+    def __init__(self, metrics_dir=None, flush_interval=2.0, buckets=DEFAULT_BUCKETS):
+        # With a metrics_dir every gunicorn worker writes its own file and /metrics sums them
+        self.metrics_dir = metrics_dir
+        self.flush_interval = flush_interval
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.help = {}
+        self.context = threading.local()
+        self.last_flush = 0.0
+        self.flush_lock = threading.Lock()
+        self.flush_ids = itertools.count()
+        if metrics_dir:
+            os.makedirs(metrics_dir, exist_ok=True)
+
+
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+
+
+    def inc(self, name, value=1, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        self.maybe_flush()
+
+
+
+    def set_gauge(self, name, value, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            self.gauges[key] = value
+        self.maybe_flush()
+
+
+
+    def observe(self, name, seconds, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    hist["buckets"][i] += 1
+                    break
+            hist["sum"] += seconds
+            hist["count"] += 1
+        self.maybe_flush()
+
+
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+
+
+    def current_method(self):
+        stack = getattr(self.context, "methods", None)
+        return stack[-1] if stack else "none"
+
+
+
+    def instrumented(self, name):
+        # Times the whole call and labels any stage timings made inside it with the method name
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                stack = getattr(self.context, "methods", None)
+                if stack is None:
+                    stack = self.context.methods = []
+                stack.append(fn.__name__)
+                try:
+                    with self.timer(name, method=fn.__name__):
+                        return fn(*args, **kwargs)
+                finally:
+                    stack.pop()
+            return wrapper
+        return decorator
+
+
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "counters": [[n, list(l), v] for (n, l), v in self.counters.items()],
+                "gauges": [[n, list(l), v] for (n, l), v in self.gauges.items()],
+                "histograms": [[n, list(l), dict(h, buckets=list(h["buckets"]))] for (n, l), h in self.histograms.items()]
+            }
+
+
+
+    def maybe_flush(self, force=False):
+        if not self.metrics_dir:
+            return
+
+        # Io pool threads and /metrics flush from the same worker, a call that finds a flush running skips it
+        if not self.flush_lock.acquire(blocking=force):
+            return
+        try:
+            now = time.monotonic()
+            if not force and now - self.last_flush < self.flush_interval:
+                return
+            self.last_flush = now
+
+            file_path = os.path.join(self.metrics_dir, f"metrics_{os.getpid()}.json")
+            tmp_path = f"{file_path}.{threading.get_ident()}.{next(self.flush_ids)}.tmp"
+            try:
+                with open(tmp_path, "w") as f:
+                    json.dump(self.snapshot(), f)
+                os.replace(tmp_path, file_path)
+            except Exception:
+                # A metrics file is never worth failing the request that recorded it
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+        finally:
+            self.flush_lock.release()
+
+
+
+    def collect(self):
+        # Counters and histogram buckets add up across workers. Gauges describe one worker,
+        # so each keeps its own series under a pid label
+        if not self.metrics_dir:
+            snapshots = [self.snapshot()]
+        else:
+            self.maybe_flush(force=True)
+            snapshots = []
+            for file_path in glob.glob(os.path.join(self.metrics_dir, "metrics_*.json")):
+                try:
+                    with open(file_path) as f:
+                        snap = json.load(f)
+                except (OSError, ValueError):
+                    continue
+
+                # Counters of dead workers still count, their gauges no longer mean anything
+                pid = int(os.path.basename(file_path)[len("metrics_"):-len(".json")])
+                if not pid_alive(pid):
+                    snap["gauges"] = []
+                snap["gauges"] = [[n, labels + [["pid", str(pid)]], v] for n, labels, v in snap["gauges"]]
+                snapshots.append(snap)
+
+        counters, gauges, histograms = {}, {}, {}
+        for snap in snapshots:
+            for name, labels, value in snap["counters"]:
+                key = (name, tuple(tuple(l) for l in labels))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, value in snap["gauges"]:
+                gauges[(name, tuple(sorted(tuple(l) for l in labels)))] = value
+            for name, labels, hist in snap["histograms"]:
+                # Files written before a bucket change cannot be merged bucket by bucket
+                if len(hist["buckets"]) != len(self.buckets):
+                    continue
+                key = (name, tuple(tuple(l) for l in labels))
+                merged = histograms.setdefault(key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+                merged["buckets"] = [a + b for a, b in zip(merged["buckets"], hist["buckets"])]
+                merged["sum"] += hist["sum"]
+                merged["count"] += hist["count"]
+
+        return counters, gauges, histograms
+
+
+
+    def render(self):
+        counters, gauges, histograms = self.collect()
+        lines = []
+
+        for metric_type, values in (("counter", counters), ("gauge", gauges)):
+            for name in sorted({n for n, _ in values}):
+                lines.extend(self.header(name, metric_type))
+                for (n, labels), value in sorted(values.items()):
+                    if n == name:
+                        lines.append(f"{name}{format_labels(labels)} {value}")
+
+        for name in sorted({n for n, _ in histograms}):
+            lines.extend(self.header(name, "histogram"))
+            for (n, labels), hist in sorted(histograms.items()):
+                if n != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets, hist["buckets"]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', repr(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {hist['count']}")
+                lines.append(f"{name}_sum{format_labels(labels)} {hist['sum']}")
+                lines.append(f"{name}_count{format_labels(labels)} {hist['count']}")
+
+        return "\n".join(lines) + "\n"
+
+
+
+    def header(self, name, metric_type):
+        lines = []
+        if name in self.help:
+            lines.append(f"# HELP {name} {self.help[name]}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        return lines
+
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+
+def label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (k + '="' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"' for k, v in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+
+METRICS = Metrics(os.environ.get("METRICS_DIR"), float(os.environ.get("METRICS_FLUSH_SECONDS", "2")))
@@ -0,0 +1,152 @@
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import pickle
+import time
+import numpy as np
+
+
+ARTIFACT_FORMAT_VERSION = 1
+
+
+class NativeModel:
+
+
+    def __init__(self, booster, metadata):
+        self.booster = booster
+        self.metadata = metadata
+
+
+
+    @classmethod
+    def from_bytes(cls, raw, metadata):
+        # Straight to a Booster, the sklearn wrapper is not needed for inference. xgboost is
+        # imported on the first model load so app startup does not pay for it
+        import xgboost
+        booster = xgboost.Booster()
+        booster.load_model(bytearray(raw))
+        return cls(booster, metadata)
+
+
+
+    def predict(self, x):
+        x = np.asarray(x, dtype=np.float32)
+        return self.booster.inplace_predict(x, validate_features=False)
+
+
+
+def get_artifact_paths(model_dir, model_nm):
+    base = os.path.join(model_dir, model_nm)
+    return base + ".ubj", base + ".json"
+
+
+
+def save_artifact(model, model_dir, model_nm, features, hyper_params=None, scores=None, train_years=None):
+    import xgboost
+    booster = model.get_booster() if hasattr(model, "get_booster") else model
+    model_path, meta_path = get_artifact_paths(model_dir, model_nm)
+
+    raw = booster.save_raw(raw_format="ubj")
+    metadata = {
+        "format_version": ARTIFACT_FORMAT_VERSION,
+        "model_nm": model_nm,
+        "xgboost_version": xgboost.__version__,
+        "created_at": datetime.datetime.utcnow().isoformat() + "Z",
+        "features": list(features),
+        "train_years": list(train_years) if train_years is not None else None,
+        "hyper_params": hyper_params,
+        "scores": scores,
+        "booster_sha1": hashlib.sha1(raw).hexdigest()
+    }
+
+    # Sidecar first and the booster last, readers key reloads off the booster file
+    write_atomic(meta_path, json.dumps(metadata, indent=2, default=float).encode())
+    write_atomic(model_path, bytes(raw))
+    return metadata
+
+
+
+def load_metadata(model_dir, model_nm):
+    _, meta_path = get_artifact_paths(model_dir, model_nm)
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+
+def write_atomic(file_path, data):
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, file_path)
+
+
+
+def convert_pickle(model_dir, model_nm, features=None):
+    # One-time move of an XGBRegressor pickle into the native artifact format
+    with open(os.path.join(model_dir, model_nm + ".pkl"), "rb") as f:
+        xgb = pickle.load(f)
+
+    booster = xgb.get_booster()
+    if features is None:
+        features = booster.feature_names
+    if features is None:
+        from mods.SchemaCatalog import CATALOG
+        features = CATALOG.feature_names()
+
+    # Not get_params(): a pickle from an older xgboost lacks the constructor arguments added since
+    import xgboost
+    params = {key: getattr(xgb, key, None) for key in xgboost.XGBModel._get_param_names()}
+    params.update(getattr(xgb, "kwargs", None) or {})
+    # missing=NaN is the default and would not be valid JSON in the sidecar
+    params = {key: val for key, val in params.items() if val is not None and not callable(val) and val == val}
+    return save_artifact(xgb, model_dir, model_nm, features, hyper_params=params)
+
+
+
+def compare_load_times(model_dir, model_nm, repeat=20):
+    pkl_path = os.path.join(model_dir, model_nm + ".pkl")
+    model_path, _ = get_artifact_paths(model_dir, model_nm)
+    metadata = load_metadata(model_dir, model_nm)
+
+    def best_time(fn):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    def load_pickle():
+        with open(pkl_path, "rb") as f:
+            return pickle.loads(f.read())
+
+    def load_native():
+        with open(model_path, "rb") as f:
+            return NativeModel.from_bytes(f.read(), metadata)
+
+    pickle_seconds = best_time(load_pickle)
+    native_seconds = best_time(load_native)
+    return {
+        "pickle_seconds": pickle_seconds,
+        "native_seconds": native_seconds,
+        "pickle_bytes": os.path.getsize(pkl_path),
+        "native_bytes": os.path.getsize(model_path),
+        "speedup": pickle_seconds / native_seconds if native_seconds > 0 else None
+    }
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert pickled xgboost models to the native artifact format")
+    parser.add_argument("command", choices=["convert", "compare"])
+    parser.add_argument("model_nm", help="model name without extension, e.g. prod_model")
+    parser.add_argument("--dir", default=os.path.abspath(os.curdir))
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        metadata = convert_pickle(args.dir, args.model_nm)
+        print(json.dumps(metadata, indent=2, default=str))
+    print(json.dumps(compare_load_times(args.dir, args.model_nm, args.repeat), indent=2))
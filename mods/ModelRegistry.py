@@ -0,0 +1,133 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from mods.Metrics import METRICS
+from mods.ModelArtifact import NativeModel, get_artifact_paths, load_metadata
+
+
+class ModelRegistry:
+
+
+    def __init__(self, model_dir, max_models=4, use_tree_evaluator=False):
+        self.model_dir = model_dir
+        self.max_models = max_models
+        self.use_tree_evaluator = use_tree_evaluator
+        self.models = OrderedDict()
+        self.lock = threading.Lock()
+        self.load_locks = {}
+        self.stats = {"hits": 0, "misses": 0, "reloads": 0}
+
+
+
+    def get_file_path(self, model_nm):
+        # Native artifacts win over the legacy pickle once a model has been converted
+        native_path, _ = get_artifact_paths(self.model_dir, model_nm)
+        if os.path.exists(native_path):
+            return native_path
+        return os.path.join(self.model_dir, model_nm + '.pkl')
+
+
+
+    def get_model(self, model_nm):
+        file_path = self.get_file_path(model_nm)
+        mtime = os.stat(file_path).st_mtime_ns
+
+        with self.lock:
+            entry = self.models.get(model_nm)
+            if entry is not None and entry["mtime"] == mtime and entry["path"] == file_path:
+                self.models.move_to_end(model_nm)
+                self.stats["hits"] += 1
+                return entry["model"]
+            load_lock = self.load_locks.setdefault(model_nm, threading.Lock())
+
+        # Only one caller per model reads the file, the rest wait and reuse it
+        with load_lock:
+            with self.lock:
+                entry = self.models.get(model_nm)
+                if entry is not None and entry["mtime"] == mtime and entry["path"] == file_path:
+                    self.models.move_to_end(model_nm)
+                    self.stats["hits"] += 1
+                    return entry["model"]
+
+            with METRICS.timer("model_load_seconds", model=model_nm, stage="read"):
+                with open(file_path, "rb") as f:
+                    raw = f.read()
+                digest = hashlib.sha1(raw).hexdigest()
+
+            # File was touched but the contents did not change
+            if entry is not None and entry["hash"] == digest and entry["path"] == file_path:
+                with self.lock:
+                    entry["mtime"] = mtime
+                    self.stats["hits"] += 1
+                return entry["model"]
+
+            if file_path.endswith('.ubj'):
+                with METRICS.timer("model_load_seconds", model=model_nm, stage="native"):
+                    model = NativeModel.from_bytes(raw, load_metadata(self.model_dir, model_nm))
+            else:
+                with METRICS.timer("model_load_seconds", model=model_nm, stage="unpickle"):
+                    model = pickle.loads(raw)
+
+            # Flat node arrays walked without xgboost, same predict() for single rows and batches
+            if self.use_tree_evaluator:
+                from mods.TreeEvaluator import TreeEvaluator
+                with METRICS.timer("model_load_seconds", model=model_nm, stage="export"):
+                    model = TreeEvaluator.from_model(model)
+            new_entry = {"model": model, "mtime": mtime, "hash": digest, "path": file_path}
+
+            # Swap the whole entry at once, in-flight predictions keep the old model object
+            with self.lock:
+                if entry is None:
+                    self.stats["misses"] += 1
+                else:
+                    self.stats["reloads"] += 1
+                self.models[model_nm] = new_entry
+                self.models.move_to_end(model_nm)
+                while len(self.models) > self.max_models:
+                    self.models.popitem(last=False)
+
+            return model
+
+
+
+    def get_version(self, model_nm):
+        # Content hash of the loaded file, changes only when the model itself does
+        self.get_model(model_nm)
+        with self.lock:
+            return self.models[model_nm]["hash"]
+
+
+
+    def preload(self, model_nms):
+        loaded = []
+        for model_nm in model_nms:
+            self.get_model(model_nm)
+            loaded.append(model_nm)
+        return loaded
+
+
+
+    def evict(self, model_nm=None):
+        with self.lock:
+            if model_nm is None:
+                self.models.clear()
+            else:
+                self.models.pop(model_nm, None)
+
+
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["loaded"] = list(self.models.keys())
+        return stats
+
+
+
+MODEL_REGISTRY = ModelRegistry(
+    os.environ.get("MODEL_DIR", os.path.abspath(os.curdir)),
+    int(os.environ.get("MODEL_CACHE_SIZE", "4")),
+    os.environ.get("USE_TREE_EVALUATOR", "").lower() in ("1", "true", "yes")
+)
@@ -0,0 +1,71 @@
+import numpy as np
+
+
+class PlayerFeatureStore:
+
+
+    def __init__(self, df, columns):
+        # One float64 matrix sorted by player then season, each player is rows offsets[i]:offsets[i + 1].
+        # Full precision on purpose: the model inputs are means of these values and must match DataFrame.mean()
+        player_ids = df["player_id"].to_numpy(dtype=np.int64)
+        years = df["mlb_year"].to_numpy(dtype=np.int16)
+        order = np.lexsort((years, player_ids))
+
+        self.columns = list(columns)
+        self.col_index = {col: idx for idx, col in enumerate(self.columns)}
+        self.values = np.empty((len(order), len(self.columns)), dtype=np.float64)
+        for idx, col in enumerate(self.columns):
+            self.values[:, idx] = df[col].to_numpy(dtype=np.float64, na_value=np.nan)[order]
+        self.years = years[order]
+
+        sorted_ids = player_ids[order]
+        starts = np.flatnonzero(np.concatenate(([True], sorted_ids[1:] != sorted_ids[:-1]))) if len(order) else np.empty(0, dtype=np.int64)
+        self.player_ids = sorted_ids[starts]
+        self.offsets = np.append(starts, len(order)).astype(np.int64)
+        self.counts = np.diff(self.offsets)
+        self.row_players = np.repeat(np.arange(len(self.player_ids), dtype=np.int32), self.counts)
+
+
+
+    def __len__(self):
+        return len(self.player_ids)
+
+
+
+    def get_col_idx(self, columns):
+        if columns is None:
+            return slice(None)
+        if isinstance(columns, str):
+            return self.col_index[columns]
+        return [self.col_index[col] for col in columns]
+
+
+
+    def latest_years(self):
+        return self.years[self.offsets[1:] - 1]
+
+
+
+    def group_means(self, columns=None, player_mask=None):
+        # Per-player column means in one pass, missing values are skipped like DataFrame.mean()
+        values = self.values[:, self.get_col_idx(columns)]
+        if len(self) == 0:
+            return np.empty((0,) + values.shape[1:])
+        present = ~np.isnan(values)
+        if present.all():
+            sums = np.add.reduceat(values, self.offsets[:-1], axis=0, dtype=np.float64)
+            counts = self.counts.reshape((-1,) + (1,) * (values.ndim - 1))
+        else:
+            sums = np.add.reduceat(np.where(present, values, 0), self.offsets[:-1], axis=0, dtype=np.float64)
+            counts = np.add.reduceat(present.astype(np.int64), self.offsets[:-1], axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / counts
+        return means if player_mask is None else means[player_mask]
+
+
+
+    def group_max(self, col, player_mask=None):
+        if len(self) == 0:
+            return np.empty(0, dtype=np.float64)
+        maxes = np.fmax.reduceat(self.values[:, self.col_index[col]], self.offsets[:-1])
+        return maxes if player_mask is None else maxes[player_mask]
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+
+RADAR_STATS = [
+    ("Home Runs", "b_home_run"),
+    ("RBI", "b_rbi"),
+    ("Hits", "b_total_hits"),
+    ("Strikeouts", "b_strikeout"),
+    ("Walks", "b_walk")
+]
+
+LINE_STATS = [
+    ("xwOBA", "xwoba"),
+    ("AVG", "batting_avg"),
+    ("OPS", "on_base_plus_slg"),
+    ("SLG", "slg_percent"),
+    ("ISO", "isolated_power")
+]
+
+GRID_COLUMNS = [
+    ("mlb_year", "Year"),
+    ("player_age", "Age"),
+    ("b_game", "Games"),
+    ("b_total_pa", "Plate Appearances"),
+    ("b_ab", "At Bats"),
+    ("b_total_hits", "Hits"),
+    ("b_single", "Singles"),
+    ("b_double", "Doubles"),
+    ("b_triple", "Triples"),
+    ("b_home_run", "Home Runs"),
+    ("b_rbi", "Runs Batted In"),
+    ("b_strikeout", "Strikeouts"),
+    ("b_walk", "Walks"),
+    ("xwoba", "xwOBA"),
+    ("batting_avg", "Batting AVG"),
+    ("on_base_percent", "On Base Perc"),
+    ("slg_percent", "Slugging Perc"),
+    ("on_base_plus_slg", "On Base Plus SLG"),
+    ("isolated_power", "Isolated Power"),
+    ("b_total_bases", "Total Bases")
+]
+
+
+class PlayerProfileStore:
+
+
+    def __init__(self, df):
+        # Rows sorted by player then season, each player is one contiguous block
+        df = df.rename(columns=str.lower)
+        df = df.sort_values(["player_id", "mlb_year"], kind="stable").reset_index(drop=True)
+        player_ids = df["player_id"].to_numpy()
+
+        starts = np.flatnonzero(np.concatenate(([True], player_ids[1:] != player_ids[:-1])))
+        ends = np.append(starts[1:], len(player_ids))
+        self.index = {int(player_ids[s]): (int(s), int(e)) for s, e in zip(starts, ends)}
+        self.df = df
+
+        # Career totals for the radar chart, one row per player and name
+        df_names = df.assign(player=df["first_name"].str.strip() + " " + df["last_name"].str.strip())
+        self.radar_totals = df_names.groupby(["player_id", "player"], sort=False)[[col for _, col in RADAR_STATS]].sum()
+
+
+
+    def get_rows(self, player_id):
+        bounds = self.index.get(int(player_id))
+        if bounds is None:
+            return self.df.iloc[0:0]
+        return self.df.iloc[bounds[0]:bounds[1]]
+
+
+
+    def get_radar_frame(self, player_id):
+        if int(player_id) not in self.index:
+            return pd.DataFrame(columns=["player", "stat", "value"])
+
+        totals = self.radar_totals.xs(int(player_id), level="player_id")
+        records = []
+        for player, row in totals.iterrows():
+            for stat, col in RADAR_STATS:
+                records.append((player, stat, row[col]))
+        return pd.DataFrame.from_records(records, columns=["player", "stat", "value"])
+
+
+
+    def get_line_frame(self, player_id):
+        rows = self.get_rows(player_id)
+        frames = [
+            pd.DataFrame({"group": group, "key": rows["mlb_year"].to_numpy(), "value": rows[col].to_numpy()})
+            for group, col in LINE_STATS
+        ]
+        line = pd.concat(frames, ignore_index=True).drop_duplicates()
+        return line.sort_values("key", kind="stable").reset_index(drop=True)
+
+
+
+    def get_grid_frame(self, player_id):
+        rows = self.get_rows(player_id)
+        grid = pd.DataFrame({alias: rows[col].to_numpy() for col, alias in GRID_COLUMNS})
+        grid.insert(0, "ID", np.arange(1, len(grid.index) + 1))
+        return grid
@@ -0,0 +1,128 @@
+import functools
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import request, Response
+
+
+class ResponseCache:
+
+
+    def __init__(self, max_entries=256, ttl=300, generation_file=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "not_modified": 0, "invalidations": 0}
+
+        # Touched on every write so the other gunicorn workers drop their entries too
+        self.generation_file = generation_file
+        self.generation = self.read_generation()
+
+
+
+    def read_generation(self):
+        if self.generation_file is None:
+            return None
+        try:
+            return os.stat(self.generation_file).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+
+
+    def get(self, key):
+        generation = self.read_generation()
+        with self.lock:
+            if generation != self.generation:
+                self.entries.clear()
+                self.generation = generation
+
+            entry = self.entries.get(key)
+            if entry is None or entry["expires"] < time.monotonic():
+                self.entries.pop(key, None)
+                self.stats["misses"] += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry
+
+
+
+    def get_token(self):
+        # Changes on any invalidation, here or in another worker
+        with self.lock:
+            invalidations = self.stats["invalidations"]
+        return self.read_generation(), invalidations
+
+
+
+    def set(self, key, body, mimetype, token=None):
+        # token is get_token() from before the body was built, a write since then means the body may be stale
+        entry = {
+            "body": body,
+            "mimetype": mimetype,
+            "etag": hashlib.sha1(body).hexdigest(),
+            "expires": time.monotonic() + self.ttl
+        }
+        if token is not None and token != self.get_token():
+            return entry
+
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+
+
+    def invalidate(self, *args):
+        with self.lock:
+            self.entries.clear()
+            self.stats["invalidations"] += 1
+
+        if self.generation_file is not None:
+            with open(self.generation_file, "a"):
+                os.utime(self.generation_file, None)
+            with self.lock:
+                self.generation = self.read_generation()
+
+
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self.entries)
+        return stats
+
+
+
+    def cached(self, fn):
+        # Caches 200 responses per endpoint and query args, answers If-None-Match with a 304
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = (request.path, tuple(sorted(request.args.items(multi=True))))
+            entry = self.get(key)
+            if entry is None:
+                token = self.get_token()
+                resp = fn(*args, **kwargs)
+                if resp.status_code != 200 or resp.is_streamed:
+                    return resp
+                entry = self.set(key, resp.get_data(), resp.mimetype, token)
+
+            if request.if_none_match.contains(entry["etag"]):
+                with self.lock:
+                    self.stats["not_modified"] += 1
+                resp = Response(status=304)
+            else:
+                resp = Response(entry["body"], status=200, mimetype=entry["mimetype"])
+
+            resp.set_etag(entry["etag"])
+            resp.headers["Cache-Control"] = "no-cache"
+            return resp
+
+        return wrapper
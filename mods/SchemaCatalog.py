@@ -0,0 +1,167 @@
+import os
+import threading
+import time
+from collections import namedtuple
+
+
+ColumnDescriptor = namedtuple("ColumnDescriptor", ["name", "position", "dtype", "is_numeric", "is_feature"])
+
+NUMERIC_TYPES = {"SMALLINT", "INTEGER", "INT", "BIGINT", "DECIMAL", "NUMERIC", "DECFLOAT", "REAL", "DOUBLE", "FLOAT"}
+
+# mlbstats columns between mlb_year and xwoba, used when no table metadata can be loaded
+DEFAULT_FEATURE_COLUMNS = [
+    "player_age",
+    "b_ab",
+    "b_total_pa",
+    "b_total_hits",
+    "b_single",
+    "b_double",
+    "b_triple",
+    "b_home_run",
+    "b_strikeout",
+    "b_walk",
+    "b_k_percent",
+    "b_bb_percent",
+    "batting_avg",
+    "slg_percent",
+    "on_base_percent",
+    "on_base_plus_slg",
+    "isolated_power",
+    "b_rbi",
+    "b_total_bases",
+    "b_ab_scoring",
+    "b_game",
+    "b_hit_line_drive",
+    "b_hit_popup",
+    "b_played_dh"
+]
+
+# Full mlbstats layout, served until the first successful load so charts work while the database is down
+DEFAULT_COLUMNS = (
+    [ColumnDescriptor("last_name", 1, "VARCHAR", False, False), ColumnDescriptor("first_name", 2, "VARCHAR", False, False)]
+    + [ColumnDescriptor("player_id", 3, "INTEGER", True, False), ColumnDescriptor("mlb_year", 4, "SMALLINT", True, False)]
+    + [ColumnDescriptor(name, 5 + i, "DOUBLE", True, True) for i, name in enumerate(DEFAULT_FEATURE_COLUMNS)]
+    + [ColumnDescriptor("xwoba", 5 + len(DEFAULT_FEATURE_COLUMNS), "DOUBLE", True, False)]
+)
+
+
+class SchemaCatalog:
+
+
+    def __init__(self, refresh_seconds=3600, year_col="mlb_year", target_col="xwoba", retry_seconds=5):
+        self.refresh_seconds = refresh_seconds
+        self.year_col = year_col
+        self.target_col = target_col
+        self.loader = None
+        self.loaded_at = None
+        self.last_error = None
+
+        # A failed load is retried after retry_seconds, doubling up to refresh_seconds
+        self.retry_seconds = retry_seconds
+        self.retry_delay = retry_seconds
+        self.retry_at = None
+        self.lock = threading.Lock()
+        self.set_columns([])
+
+
+
+    def bind(self, loader):
+        # loader() returns a DataFrame with NAME, COLNO and COLTYPE for the stats table
+        with self.lock:
+            self.loader = loader
+            self.loaded_at = None
+            self.retry_at = None
+
+
+
+    def set_columns(self, columns):
+        columns = columns or DEFAULT_COLUMNS
+        names = {c.name for c in columns}
+        features = [c.name for c in columns if c.is_feature]
+
+        # Swap everything in one assignment so readers never see a half refreshed catalog
+        self.state = {
+            "columns": {c.name: c for c in columns},
+            "names": names,
+            "features": features if features else list(DEFAULT_FEATURE_COLUMNS)
+        }
+
+
+
+    def is_stale(self):
+        now = time.monotonic()
+        if self.retry_at is not None and now < self.retry_at:
+            return False
+        return self.loaded_at is None or now - self.loaded_at >= self.refresh_seconds
+
+
+
+    def refresh_if_stale(self):
+        if self.loader is None or not self.is_stale():
+            return
+
+        with self.lock:
+            if not self.is_stale():
+                return
+            try:
+                self.set_columns(self.build_columns(self.loader()))
+                self.loaded_at = time.monotonic()
+                self.last_error = None
+                self.retry_at = None
+                self.retry_delay = self.retry_seconds
+            except Exception as e:
+                # Keeps the previous catalog, or the default layout before the first load, and retries soon
+                self.last_error = repr(e)
+                self.retry_at = time.monotonic() + self.retry_delay
+                self.retry_delay = min(self.retry_delay * 2, self.refresh_seconds)
+
+
+
+    def build_columns(self, df):
+        rows = sorted(
+            ((int(r["colno"]), str(r["name"]).strip().lower(), str(r["coltype"]).strip().upper()) for r in df.to_dict("records")),
+            key=lambda r: r[0]
+        )
+        names = [r[1] for r in rows]
+        year_pos = names.index(self.year_col) if self.year_col in names else None
+        target_pos = names.index(self.target_col) if self.target_col in names else None
+
+        columns = []
+        for i, (colno, name, coltype) in enumerate(rows):
+            is_numeric = coltype in NUMERIC_TYPES
+            is_feature = (
+                is_numeric
+                and year_pos is not None
+                and target_pos is not None
+                and year_pos < i < target_pos
+            )
+            columns.append(ColumnDescriptor(name, colno, coltype, is_numeric, is_feature))
+        return columns
+
+
+
+    def get_columns(self):
+        self.refresh_if_stale()
+        return list(self.state["columns"].values())
+
+
+
+    def get_column(self, name):
+        self.refresh_if_stale()
+        return self.state["columns"].get(str(name).lower())
+
+
+
+    def is_valid_field(self, name):
+        self.refresh_if_stale()
+        return str(name).lower() in self.state["names"]
+
+
+
+    def feature_names(self):
+        self.refresh_if_stale()
+        return self.state["features"]
+
+
+
+CATALOG = SchemaCatalog(int(os.environ.get("SCHEMA_REFRESH_SECONDS", "3600")))
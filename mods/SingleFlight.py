@@ -0,0 +1,229 @@
+import fcntl
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from flask import request, Response
+from mods.Metrics import METRICS
+
+
+class Call:
+
+    __slots__ = ("event", "result", "error", "waiters", "listeners", "last_progress")
+
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+        self.listeners = []
+        self.last_progress = None
+
+
+
+class SingleFlight:
+
+
+    def __init__(self, lock_dir=None, poll_interval=0.1, result_ttl=3600):
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.poll_interval = poll_interval
+        self.stats = {"leaders": 0, "coalesced": 0, "cross_worker_coalesced": 0, "lock_waits": 0}
+
+        # Lock and result files shared by every gunicorn worker on the host, results and progress
+        # files older than result_ttl are swept after each run
+        self.lock_dir = lock_dir
+        self.result_ttl = result_ttl
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+
+
+
+    def do(self, key, fn, name="call", progress=None):
+        # First caller for a key runs fn, callers arriving while it runs wait and get the same result.
+        # progress(done, total) hears whatever the running call reports through report()
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Call()
+                self.stats["leaders"] += 1
+            else:
+                call.waiters += 1
+                self.stats["coalesced"] += 1
+            if progress is not None:
+                call.listeners.append(progress)
+            last_progress = call.last_progress
+
+        if progress is not None and last_progress is not None:
+            progress(*last_progress)
+
+        if not leader:
+            METRICS.inc("singleflight_coalesced_total", call=name, scope="worker")
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, False
+
+        try:
+            call.result = fn()
+            return call.result, True
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                self.calls.pop(key, None)
+            call.event.set()
+
+
+
+    def exclusive(self, lock_key, result_key, fn, name="call", progress=None):
+        # Write paths: one run per lock_key across workers, and a worker that waited on an identical
+        # run (same result_key) reuses its result instead of repeating it. fn(report) must return
+        # JSON data, report(done, total) reaches progress for the caller and every coalesced one
+        key = key_digest(result_key)
+        return self.do(key, lambda: self.run_locked(lock_key, key, fn, name), name, progress)[0]
+
+
+
+    def report(self, key, done, total, publish=True):
+        with self.lock:
+            call = self.calls.get(key)
+            if call is None:
+                return
+            call.last_progress = (done, total)
+            listeners = list(call.listeners)
+        for listener in listeners:
+            listener(done, total)
+
+        # Workers queued behind this run on the lock poll the file
+        if publish and self.lock_dir:
+            write_result(os.path.join(self.lock_dir, key + ".progress"), [done, total])
+
+
+
+    def run_locked(self, lock_key, key, fn, name):
+        report = lambda done, total: self.report(key, done, total)
+        if not self.lock_dir:
+            return fn(report)
+
+        lock_path = os.path.join(self.lock_dir, key_digest(lock_key) + ".lock")
+        result_path = os.path.join(self.lock_dir, key + ".result")
+        progress_path = os.path.join(self.lock_dir, key + ".progress")
+        started = time.time_ns()
+
+        with open(lock_path, "a") as lock_file:
+            waited = not self.try_lock(lock_file)
+            if waited:
+                with self.lock:
+                    self.stats["lock_waits"] += 1
+                with METRICS.timer("singleflight_lock_wait_seconds", call=name):
+                    seen = None
+                    while not self.try_lock(lock_file):
+                        # Progress of an identical run in another worker, passed on to our callers
+                        latest = read_result(progress_path, started)
+                        if latest is not None and latest != seen:
+                            seen = latest
+                            self.report(key, *latest, publish=False)
+                        time.sleep(self.poll_interval)
+
+            try:
+                # Finished while we were queued behind it
+                if waited:
+                    result = read_result(result_path, started)
+                    if result is not None:
+                        with self.lock:
+                            self.stats["cross_worker_coalesced"] += 1
+                        METRICS.inc("singleflight_coalesced_total", call=name, scope="host")
+                        return result
+
+                result = fn(report)
+                write_result(result_path, result)
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                self.expire_files()
+
+
+
+    def expire_files(self):
+        # One result per distinct request body, kept long enough for the waiters queued behind it
+        cutoff = time.time() - self.result_ttl
+        for entry in os.scandir(self.lock_dir):
+            if not entry.name.endswith((".result", ".progress", ".tmp")):
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+
+
+    def try_lock(self, lock_file):
+        # Non-blocking so a gevent worker keeps serving other requests while it waits
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+
+
+    def coalesced(self, fn):
+        # Identical concurrent requests (method, path, args, body) share one execution; streamed
+        # responses cannot be replayed, so waiters for one of those run the view themselves
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = (request.method, request.path, tuple(sorted(request.args.items(multi=True))), request.get_data())
+
+            def call():
+                resp = fn(*args, **kwargs)
+                if resp.is_streamed:
+                    return resp
+                return resp.get_data(), resp.status_code, resp.mimetype
+
+            result, leader = self.do(key, call, fn.__name__)
+            if isinstance(result, Response):
+                return result if leader else fn(*args, **kwargs)
+
+            body, status, mimetype = result
+            return Response(body, status=status, mimetype=mimetype)
+
+        return wrapper
+
+
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = len(self.calls)
+        return stats
+
+
+
+def key_digest(key):
+    return hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+
+
+def read_result(result_path, since_ns):
+    try:
+        if os.stat(result_path).st_mtime_ns < since_ns:
+            return None
+        with open(result_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+
+def write_result(result_path, result):
+    tmp_path = f"{result_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(result, f, default=str)
+    os.replace(tmp_path, result_path)
@@ -0,0 +1,162 @@
+import datetime
+import os
+import threading
+import pandas as pd
+import pyarrow as pa
+
+
+class SnapshotCache:
+
+
+    def __init__(self, cache_dir, fetch_fn, year_col='mlb_year', table_nm='mlbstats'):
+        # fetch_fn(start_yr, end_yr) returns the DataFrame for that inclusive range from the database
+        self.cache_dir = cache_dir
+        self.fetch_fn = fetch_fn
+        self.year_col = year_col
+        self.table_nm = table_nm
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "db_queries": 0, "writes": 0, "invalidations": 0}
+        os.makedirs(cache_dir, exist_ok=True)
+
+
+
+    def get_file_path(self, year):
+        return os.path.join(self.cache_dir, f"{self.table_nm}_{year}.arrow")
+
+
+
+    def is_completed(self, year):
+        # Only finished seasons are frozen on disk, the current one always goes to the database
+        return year < datetime.date.today().year
+
+
+
+    def get_range(self, start_yr, end_yr):
+        start_yr, end_yr = int(start_yr), int(end_yr)
+        partitions = {}
+        missing = []
+
+        for year in range(start_yr, end_yr + 1):
+            file_path = self.get_file_path(year)
+            table = self.read_partition(file_path) if self.is_completed(year) and os.path.exists(file_path) else None
+            # Zero row files from before empty seasons were skipped are looked up again
+            if table is not None and table.num_rows > 0:
+                partitions[year] = table
+                self.count("hits")
+            else:
+                missing.append(year)
+                self.count("misses")
+
+        for range_start, range_end in group_ranges(missing):
+            df = self.fetch_fn(str(range_start), str(range_end))
+            self.count("db_queries")
+            years = pd.to_numeric(df[self.year_col])
+            for year in range(range_start, range_end + 1):
+                df_year = df[years == year].reset_index(drop=True)
+                partitions[year] = df_year
+                # A past season not loaded yet stays uncached, so a later load is picked up
+                if self.is_completed(year) and len(df_year.index) > 0:
+                    self.write_partition(year, df_year)
+
+        frames = combine_partitions([partitions[year] for year in sorted(partitions)])
+        non_empty = [df for df in frames if len(df.index) > 0]
+        if len(non_empty) == 0:
+            return frames[0] if frames else pd.DataFrame()
+        if len(non_empty) == 1:
+            return non_empty[0]
+        return pd.concat(non_empty, ignore_index=True)
+
+
+
+    def read_partition(self, file_path):
+        # The table's buffers point into the memory map, nothing is copied onto the heap here
+        with pa.memory_map(file_path, 'r') as source:
+            return pa.ipc.open_file(source).read_all()
+
+
+
+    def write_partition(self, year, df):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        file_path = self.get_file_path(year)
+        tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+        # Readers only ever see a complete file
+        os.replace(tmp_path, file_path)
+        self.count("writes")
+
+
+
+    def invalidate(self, year=None):
+        removed = []
+        for file_nm in os.listdir(self.cache_dir):
+            if not file_nm.startswith(self.table_nm + "_") or not file_nm.endswith(".arrow"):
+                continue
+            if year is not None and file_nm != os.path.basename(self.get_file_path(year)):
+                continue
+            os.remove(os.path.join(self.cache_dir, file_nm))
+            removed.append(file_nm)
+
+        self.count("invalidations")
+        return removed
+
+
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats["cached_years"] = sorted(
+            int(f[len(self.table_nm) + 1:-len(".arrow")])
+            for f in os.listdir(self.cache_dir)
+            if f.startswith(self.table_nm + "_") and f.endswith(".arrow")
+        )
+        return stats
+
+
+
+def combine_partitions(partitions):
+    # Runs of cached seasons are joined as Arrow tables and converted to pandas once, the only copy
+    # out of the memory maps. Seasons fetched from the database are already DataFrames
+    frames = []
+    tables = []
+    for part in partitions + [None]:
+        if isinstance(part, pa.Table):
+            tables.append(part)
+            continue
+        if tables:
+            frames.append(tables_to_pandas(tables))
+            tables = []
+        if part is not None:
+            frames.append(part)
+    return frames
+
+
+
+def tables_to_pandas(tables):
+    try:
+        table = pa.concat_tables(tables, promote=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Seasons written with different column types, e.g. a column that was all NULL in one year
+        return pd.concat([t.to_pandas() for t in tables], ignore_index=True)
+    return table.to_pandas()
+
+
+
+def group_ranges(years):
+    # [2015, 2016, 2018] -> [(2015, 2016), (2018, 2018)]
+    ranges = []
+    for year in years:
+        if ranges and ranges[-1][1] == year - 1:
+            ranges[-1] = (ranges[-1][0], year)
+        else:
+            ranges.append((year, year))
+    return ranges
@@ -0,0 +1,204 @@
+import argparse
+import os
+from abc import ABC, abstractmethod
+import sqlalchemy as sa
+import pandas as pd
+from mods.SchemaCatalog import DEFAULT_FEATURE_COLUMNS
+
+
+# mlbstats layout the iloc slices and the schema catalog expect:
+# names, player_id, mlb_year, the model features, then xwoba
+MLBSTATS_COLUMNS = (
+    [("last_name", "VARCHAR(50)"), ("first_name", "VARCHAR(50)"), ("player_id", "INTEGER"), ("mlb_year", "SMALLINT")]
+    + [(col, "DOUBLE" if col.endswith(("_percent", "_avg", "_slg", "_power")) else "INTEGER") for col in DEFAULT_FEATURE_COLUMNS]
+    + [("xwoba", "DOUBLE")]
+)
+
+EMBEDDED_TABLES = {
+    "mlbstats": MLBSTATS_COLUMNS,
+    "players": [
+        ("player_id", "INTEGER"),
+        ("first_name", "VARCHAR(50)"),
+        ("last_name", "VARCHAR(50)")
+    ],
+    "player_predictions": [
+        ("player_id", "INTEGER"),
+        ("mlb_year", "SMALLINT"),
+        ("xwoba_predicted", "DECIMAL(6,3)"),
+        ("rsquared", "REAL"),
+        ("model", "VARCHAR(50)")
+    ],
+    "player_prediction_fingerprints": [
+        ("player_id", "INTEGER"),
+        ("mlb_year", "SMALLINT"),
+        ("fingerprint", "VARCHAR(40)")
+    ],
+    "xgboost_scores": [
+        ("model_type", "VARCHAR(50)"),
+        ("training", "DOUBLE"),
+        ("mean_cv", "DOUBLE"),
+        ("kfold_cv_avg", "DOUBLE"),
+        ("mse", "DOUBLE"),
+        ("rsquared", "DOUBLE"),
+        ("explained_var", "DOUBLE")
+    ],
+    "xgboost_hyperparams": [
+        ("model_type", "VARCHAR(50)"),
+        ("n_estimators", "INTEGER"),
+        ("subsample", "DOUBLE"),
+        ("max_depth", "INTEGER"),
+        ("learning_rate", "DOUBLE"),
+        ("gamma", "DOUBLE"),
+        ("reg_alpha", "DOUBLE"),
+        ("reg_lambda", "DOUBLE")
+    ]
+}
+
+
+class StorageBackend(ABC):
+
+    # A subclass missing get_url or query_stats_schema fails when it is created, not mid-request
+    name = None
+    supports_median = True
+
+
+    @abstractmethod
+    def get_url(self):
+        pass
+
+
+
+    def get_engine_options(self):
+        return {}
+
+
+
+    def prepare(self, engine):
+        pass
+
+
+
+    @abstractmethod
+    def query_stats_schema(self, db):
+        pass
+
+
+
+class DB2Backend(StorageBackend):
+
+    name = "db2"
+
+
+    def __init__(self, db2_creds, schema_nm='MLN78422'):
+        self.db2_creds = db2_creds
+        self.schema_nm = schema_nm
+
+
+
+    def get_url(self):
+        # Imported on first connect so neither the embedded backend nor app startup needs the DB2 driver
+        import ibm_db_sa    # noqa: F401
+
+        creds = self.db2_creds
+        return creds.get("url") or f"db2+ibm_db://{creds['user']}:{creds['pw']}@{creds['host']}:{creds['port']}/{creds['db']}"
+
+
+
+    def query_stats_schema(self, db):
+        params = [self.schema_nm]
+        sql = (
+            "SELECT NAME AS name, COLNO AS colno, COLTYPE AS coltype "
+            "FROM SYSIBM.SYSCOLUMNS WHERE TBCREATOR = ? AND TBNAME = 'MLBSTATS'"
+        )
+        return db.read_frame(sql, params)
+
+
+
+class SQLiteBackend(StorageBackend):
+
+    name = "sqlite"
+    supports_median = False
+
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+
+
+    def get_url(self):
+        return f"sqlite:///{os.path.abspath(self.db_path)}"
+
+
+
+    def get_engine_options(self):
+        # Pooled connections move between request threads
+        return {"connect_args": {"check_same_thread": False}}
+
+
+
+    def prepare(self, engine):
+        with engine.begin() as conn:
+            conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+            for table_nm, columns in EMBEDDED_TABLES.items():
+                cols = ", ".join(f"{col} {col_type}" for col, col_type in columns)
+                conn.exec_driver_sql(f"CREATE TABLE IF NOT EXISTS {table_nm} ({cols})")
+            conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS mlbstats_player ON mlbstats(player_id, mlb_year)")
+            conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS player_predictions_year ON player_predictions(mlb_year, player_id)")
+            conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS player_prediction_fingerprints_year ON player_prediction_fingerprints(mlb_year, player_id)")
+
+
+
+    def query_stats_schema(self, db):
+        df = db.read_frame("SELECT cid + 1 AS colno, name, type AS coltype FROM pragma_table_info('mlbstats')")
+        df['coltype'] = df['coltype'].str.split('(').str[0]
+        return df
+
+
+
+def create_backend(config):
+    backend_nm = (config.get("backend") or "db2").lower()
+    if backend_nm == "sqlite":
+        return SQLiteBackend(config.get("sqlite_path") or "mlbstats.sqlite")
+    if backend_nm == "db2":
+        return DB2Backend(config, config.get("schema") or 'MLN78422')
+    raise ValueError("Unknown storage backend " + backend_nm)
+
+
+
+def load_table_file(engine, table_nm, file_path, if_exists="append"):
+    if file_path.endswith(".parquet"):
+        df = pd.read_parquet(file_path)
+    else:
+        df = pd.read_csv(file_path)
+    df.columns = [str(col).strip().lower() for col in df.columns]
+
+    # Keep the embedded column order, the feature slices depend on it
+    if table_nm in EMBEDDED_TABLES:
+        expected = [col for col, _ in EMBEDDED_TABLES[table_nm]]
+        missing = [col for col in expected if col not in df.columns]
+        if missing:
+            raise ValueError(f"{file_path} is missing columns {missing}")
+        df = df[expected]
+
+    df.to_sql(table_nm, engine, if_exists=if_exists, index=False, chunksize=5000)
+    return len(df.index)
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load CSV or Parquet files into the embedded SQLite backend")
+    parser.add_argument("db_path")
+    parser.add_argument("table", choices=sorted(EMBEDDED_TABLES))
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--replace", action="store_true", help="empty the table before loading")
+    args = parser.parse_args()
+
+    backend = SQLiteBackend(args.db_path)
+    engine = sa.create_engine(backend.get_url(), **backend.get_engine_options())
+    backend.prepare(engine)
+    if args.replace:
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"DELETE FROM {args.table}")
+
+    for file_path in args.files:
+        print(f"{file_path}: {load_table_file(engine, args.table, file_path)} rows -> {args.table}")
@@ -0,0 +1,225 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+from mods.ModelArtifact import NativeModel
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+# Objectives whose prediction is base_score plus the summed leaves, nothing else is exported
+IDENTITY_OBJECTIVES = {"reg:squarederror", "reg:linear", "reg:squaredlogerror", "reg:pseudohubererror", "reg:absoluteerror"}
+
+
+class TreeEvaluator:
+
+
+    def __init__(self, feature, threshold, left, right, default_left, value, roots, base_score, metadata=None):
+        # One flat node table for the whole forest, leaves have feature -1 and point at themselves
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.default_left = default_left
+        self.value = value
+        self.roots = roots
+        self.base_score = base_score
+        self.metadata = metadata
+        self.max_depth = self.get_max_depth()
+
+
+
+    @classmethod
+    def from_booster(cls, booster, metadata=None):
+        config = json.loads(booster.save_config())
+        learner = config["learner"]
+        if learner["gradient_booster"]["name"] != "gbtree":
+            raise ValueError("Only gbtree boosters can be exported")
+        if learner["objective"]["name"] not in IDENTITY_OBJECTIVES:
+            raise ValueError("Unsupported objective " + learner["objective"]["name"])
+
+        # 1.x writes "5E-1", newer releases a one element vector "[5E-1]"
+        base_score = float(learner["learner_model_param"]["base_score"].strip("[]"))
+        feature_names = booster.feature_names
+        feature_idx = {name: idx for idx, name in enumerate(feature_names)} if feature_names else None
+
+        nodes = []
+        roots = []
+        for dump in booster.get_dump(dump_format="json"):
+            tree = json.loads(dump)
+            offset = len(nodes)
+            roots.append(offset)
+
+            # nodeid is only unique within a tree, shift every tree into its own slice of the table
+            tree_nodes = {}
+            stack = [tree]
+            while stack:
+                node = stack.pop()
+                tree_nodes[node["nodeid"]] = node
+                stack.extend(node.get("children", []))
+
+            for nodeid in range(len(tree_nodes)):
+                node = tree_nodes[nodeid]
+                if "leaf" in node:
+                    nodes.append((-1, 0.0, offset + nodeid, offset + nodeid, True, node["leaf"]))
+                    continue
+
+                split = node["split"]
+                feature = feature_idx[split] if feature_idx is not None else int(split[1:])
+                nodes.append((
+                    feature,
+                    node["split_condition"],
+                    offset + node["yes"],
+                    offset + node["no"],
+                    node["missing"] == node["yes"],
+                    0.0
+                ))
+
+        feature, threshold, left, right, default_left, value = zip(*nodes)
+        return cls(
+            np.array(feature, dtype=np.int32),
+            np.array(threshold, dtype=np.float32),
+            np.array(left, dtype=np.int32),
+            np.array(right, dtype=np.int32),
+            np.array(default_left, dtype=np.bool_),
+            np.array(value, dtype=np.float32),
+            np.array(roots, dtype=np.int32),
+            base_score,
+            metadata
+        )
+
+
+
+    @classmethod
+    def from_model(cls, model):
+        # NativeModel artifacts, XGBRegressor pickles or a bare Booster
+        if isinstance(model, NativeModel):
+            return cls.from_booster(model.booster, model.metadata)
+        if hasattr(model, "get_booster"):
+            return cls.from_booster(model.get_booster())
+        return cls.from_booster(model)
+
+
+
+    def get_max_depth(self):
+        frontier = self.roots
+        levels = 0
+        while True:
+            splits = frontier[self.feature[frontier] >= 0]
+            if len(splits) == 0:
+                return levels
+            levels += 1
+            frontier = np.concatenate((self.left[splits], self.right[splits]))
+
+
+
+    def predict(self, x):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        if x.ndim == 1:
+            x = x[None, :]
+        if traverse_compiled is not None:
+            return traverse_compiled(x, self.feature, self.threshold, self.left, self.right, self.default_left, self.value, self.roots, np.float32(self.base_score))
+
+        # Every (row, tree) pair walks down one level per step, finished pairs sit on their leaf
+        rows = np.arange(len(x))[:, None]
+        node = np.broadcast_to(self.roots, (len(x), len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            feature = self.feature[node]
+            values = x[rows, np.maximum(feature, 0)]
+            go_left = np.where(np.isnan(values), self.default_left[node], values < self.threshold[node])
+            node = np.where(go_left, self.left[node], self.right[node])
+
+        return (self.value[node].sum(axis=1, dtype=np.float64) + self.base_score).astype(np.float32)
+
+
+
+def traverse_rows(x, feature, threshold, left, right, default_left, value, roots, base_score):
+    # Scalar walk of every tree for every row, only fast once numba has compiled it
+    out = np.empty(x.shape[0], dtype=np.float32)
+    for i in range(x.shape[0]):
+        total = 0.0
+        for root in roots:
+            node = root
+            while feature[node] >= 0:
+                val = x[i, feature[node]]
+                if np.isnan(val):
+                    node = left[node] if default_left[node] else right[node]
+                elif val < threshold[node]:
+                    node = left[node]
+                else:
+                    node = right[node]
+            total += value[node]
+        out[i] = total + base_score
+    return out
+
+
+
+traverse_compiled = numba.njit(cache=True, nogil=True)(traverse_rows) if numba is not None else None
+
+
+
+def compare_latency(model, x, repeat=1000):
+    # Median and p99 microseconds per call, for one row and for the whole batch
+    import xgboost
+    booster = model.booster if isinstance(model, NativeModel) else model.get_booster()
+    evaluator = TreeEvaluator.from_model(model)
+    x = np.ascontiguousarray(x, dtype=np.float32)
+
+    def latency(fn, arg, n):
+        fn(arg)
+        timings = []
+        for _ in range(n):
+            start = time.perf_counter()
+            fn(arg)
+            timings.append(time.perf_counter() - start)
+        return {"p50_us": float(np.percentile(timings, 50) * 1e6), "p99_us": float(np.percentile(timings, 99) * 1e6)}
+
+    expected = booster.predict(xgboost.DMatrix(x))
+    actual = evaluator.predict(x)
+    single = x[:1]
+    batch_repeat = max(1, repeat // 100)
+
+    return {
+        "trees": len(evaluator.roots),
+        "nodes": len(evaluator.feature),
+        "compiled": traverse_compiled is not None,
+        "max_abs_diff": float(np.max(np.abs(expected - actual))) if len(x) else 0.0,
+        "single": {
+            "dmatrix": latency(lambda a: booster.predict(xgboost.DMatrix(a)), single, repeat),
+            "inplace": latency(lambda a: booster.inplace_predict(a, validate_features=False), single, repeat),
+            "evaluator": latency(evaluator.predict, single, repeat)
+        },
+        "batch_rows": len(x),
+        "batch": {
+            "inplace": latency(lambda a: booster.inplace_predict(a, validate_features=False), x, batch_repeat),
+            "evaluator": latency(evaluator.predict, x, batch_repeat)
+        }
+    }
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the flat tree evaluator against xgboost and time both")
+    parser.add_argument("model_nm", help="model name without extension, e.g. prod_model")
+    parser.add_argument("--dir", default=os.path.abspath(os.curdir))
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+
+    from mods.ModelRegistry import ModelRegistry
+    model = ModelRegistry(args.dir).get_model(args.model_nm)
+    if isinstance(model, TreeEvaluator):
+        raise SystemExit("Unset USE_TREE_EVALUATOR to compare against xgboost")
+
+    # Random rows inside the range of every split threshold the model uses
+    evaluator = TreeEvaluator.from_model(model)
+    n_features = int(evaluator.feature.max()) + 1
+    rng = np.random.default_rng(0)
+    lows = np.array([evaluator.threshold[evaluator.feature == f].min(initial=0.0) for f in range(n_features)])
+    highs = np.array([evaluator.threshold[evaluator.feature == f].max(initial=1.0) for f in range(n_features)])
+    x = rng.uniform(lows, highs, size=(args.rows, n_features))
+    print(json.dumps(compare_latency(model, x, args.repeat), indent=2))
@@ -0,0 +1,149 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
+import xgboost
+from sklearn.model_selection import KFold
+from sklearn.metrics import r2_score
+
+
+# sklearn wrapper argument -> native xgboost.train parameter
+NATIVE_PARAM_NAMES = {
+    "learning_rate": "eta",
+    "reg_alpha": "alpha",
+    "reg_lambda": "lambda",
+    "random_state": "seed",
+    "n_jobs": "nthread"
+}
+
+# Shared with the final fit in create_xgboost_model so the CV scores describe the model that is kept
+TREE_METHOD = "hist"
+
+# Share of each fold's training rows held out to pick the early stopping round
+EARLY_STOPPING_FRACTION = 0.1
+
+
+
+def get_train_params(hyper_params, seed, nthread):
+    params = {"objective": "reg:squarederror", "tree_method": TREE_METHOD, "seed": seed}
+    for key, val in hyper_params.items():
+        if key == "n_estimators":
+            continue
+        params[NATIVE_PARAM_NAMES.get(key, key)] = val
+    params["nthread"] = nthread
+    return params
+
+
+
+def fit_fold(data, y, train_idx, test_idx, params, num_rounds, early_stopping_rounds):
+    # data is a shared DMatrix for thread pools and a plain float32 array for process pools
+    start = time.perf_counter()
+
+    # Early stopping watches rows split off the training side, test_idx is only ever scored
+    valid_idx = None
+    if early_stopping_rounds:
+        shuffled = np.random.default_rng(params.get("seed", 0)).permutation(train_idx)
+        n_valid = max(1, int(len(shuffled) * EARLY_STOPPING_FRACTION))
+        valid_idx = np.sort(shuffled[:n_valid])
+        train_idx = np.sort(shuffled[n_valid:])
+
+    if isinstance(data, xgboost.DMatrix):
+        make_dmatrix = data.slice
+    else:
+        make_dmatrix = lambda idx: xgboost.DMatrix(data[idx], label=y[idx])
+    dtrain = make_dmatrix(train_idx)
+    dtest = make_dmatrix(test_idx)
+
+    evals = [(make_dmatrix(valid_idx), "valid")] if early_stopping_rounds else []
+    booster = xgboost.train(
+        params,
+        dtrain,
+        num_boost_round=num_rounds,
+        evals=evals,
+        early_stopping_rounds=early_stopping_rounds,
+        verbose_eval=False
+    )
+
+    if early_stopping_rounds:
+        best_iteration = booster.best_iteration
+        predictions = booster.predict(dtest, iteration_range=(0, best_iteration + 1))
+    else:
+        best_iteration = num_rounds - 1
+        predictions = booster.predict(dtest)
+
+    return {
+        "score": float(r2_score(y[test_idx], predictions)),
+        "best_iteration": int(best_iteration),
+        "seconds": time.perf_counter() - start
+    }
+
+
+
+class XGBCrossValidator:
+
+
+    def __init__(self, hyper_params, n_splits=10, seed=0, max_workers=None, executor="thread", early_stopping_rounds=None):
+        self.hyper_params = hyper_params
+        self.n_splits = n_splits
+        self.seed = seed
+        self.max_workers = max_workers or min(os.cpu_count() or 1, 2 * n_splits)
+        self.executor = executor
+        self.early_stopping_rounds = early_stopping_rounds
+
+
+
+    def get_train_params(self):
+        # Split the cores between the folds running at the same time
+        return get_train_params(self.hyper_params, self.seed, max(1, (os.cpu_count() or 1) // self.max_workers))
+
+
+
+    def get_splits(self, n_rows):
+        # "mean_cv" mirrors cross_val_score(cv=10), "kf_cv" the shuffled KFold
+        placeholder = np.empty(n_rows)
+        splits = []
+        for fold, (train_idx, test_idx) in enumerate(KFold(n_splits=self.n_splits).split(placeholder)):
+            splits.append(("mean_cv", fold, train_idx, test_idx))
+
+        kf = KFold(n_splits=self.n_splits, shuffle=True, random_state=self.seed)
+        for fold, (train_idx, test_idx) in enumerate(kf.split(placeholder)):
+            splits.append(("kf_cv", fold, train_idx, test_idx))
+
+        return splits
+
+
+
+    def run(self, x, y):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        y = np.ascontiguousarray(y, dtype=np.float32).ravel()
+        params = self.get_train_params()
+        num_rounds = int(self.hyper_params.get("n_estimators", 100))
+
+        if self.executor == "process":
+            pool_cls = ProcessPoolExecutor
+            data = x
+        else:
+            # Built once, every fold takes a row slice of it
+            pool_cls = ThreadPoolExecutor
+            data = xgboost.DMatrix(x, label=y)
+
+        start = time.perf_counter()
+        folds = []
+        with pool_cls(max_workers=self.max_workers) as pool:
+            futures = []
+            for split_nm, fold, train_idx, test_idx in self.get_splits(len(y)):
+                future = pool.submit(fit_fold, data, y, train_idx, test_idx, params, num_rounds, self.early_stopping_rounds)
+                futures.append((split_nm, fold, future))
+
+            for split_nm, fold, future in futures:
+                result = future.result()
+                result["split"] = split_nm
+                result["fold"] = fold
+                folds.append(result)
+
+        return {
+            "mean_cv": float(np.mean([f["score"] for f in folds if f["split"] == "mean_cv"])),
+            "kf_cv": float(np.mean([f["score"] for f in folds if f["split"] == "kf_cv"])),
+            "folds": folds,
+            "seconds": time.perf_counter() - start
+        }